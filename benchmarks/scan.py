@@ -0,0 +1,69 @@
+"""
+Compare the initial file_monitor scan with a recursive glob.
+
+Builds a synthetic archive of empty ``.h5`` files laid out as
+``<root>/<year>/<day>/<time>_EHZ.h5`` and times ``sorted(glob.glob(...))``
+against :func:`shakeflow.watchdog.scan` without cache, with a cold cache and
+with a warm cache.
+
+    python benchmarks/scan.py --files 1000000 --root /tmp/shakeflow_scan
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+from shakeflow.watchdog import scan
+
+
+def build_tree(root, n_files, files_per_dir=144):
+    marker = os.path.join(root, f".built_{n_files}")
+    if os.path.exists(marker):
+        return
+    for i in range(n_files):
+        day, index = divmod(i, files_per_dir)
+        directory = os.path.join(root, str(2000 + day // 365), f"{day % 365:03d}")
+        if index == 0:
+            os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, f"{index:06d}_EHZ.h5"), "w").close()
+    open(marker, "w").close()
+
+
+def timed(label, func):
+    t0 = time.perf_counter()
+    n = func()
+    print(f"{label:<24} {time.perf_counter() - t0:8.2f} s  ({n} files)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--root", default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    root = args.root or os.path.join(tempfile.gettempdir(), "shakeflow_scan")
+    os.makedirs(root, exist_ok=True)
+    build_tree(root, args.files)
+    cache = os.path.join(root, ".scan_cache.db")
+    if os.path.exists(cache):
+        os.remove(cache)
+
+    timed(
+        "glob",
+        lambda: len(sorted(glob.glob(os.path.join(root, "**/*.h5"), recursive=True))),
+    )
+    timed("scan", lambda: sum(1 for _ in scan(root, ".h5", workers=args.workers)))
+    timed(
+        "scan (cold cache)",
+        lambda: sum(1 for _ in scan(root, ".h5", workers=args.workers, cache=cache)),
+    )
+    timed(
+        "scan (warm cache)",
+        lambda: sum(1 for _ in scan(root, ".h5", workers=args.workers, cache=cache)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,42 @@
 # %%
 import sys
-import time
+import threading
 import numpy as np
 from pathlib import Path
-from obspy import UTCDateTime
+from concurrent.futures import ThreadPoolExecutor
+from obspy import Trace, UTCDateTime
 from joblib import Parallel, delayed
-from obspy.clients.fdsn import Client
 
 sys.path.append("/Users/yinfu/ohmyshake/shakecore")
 sys.path.append("/Users/yinfu/ohmyshake/shakeflow")
 
 from shakecore import Stream
 from shakeflow import time_monitor, get_logger
+from shakeflow.clients import FDSNDownloader, InventoryCache
+from shakeflow.pipeline import DeadLetterQueue, RetryPolicy
+from shakeflow.utils import SharedArrays
 
 
 # watchdog parameters
-starttime = UTCDateTime() - 24 * 60 * 60  # set the start time to be the current time
 time_interval = 60 * 10  # data segment to download as one file, in seconds
+starttime = UTCDateTime() - 24 * 60 * 60  # one day ago, aligned to time_interval
+starttime = UTCDateTime(starttime.timestamp // time_interval * time_interval)
 time_lagging = 60 * 60  # some lagging time, in seconds
+windows = 4  # number of windows downloaded in parallel during a backfill
+live_windows = 2  # latest windows downloaded before the backlog
+live_share = 0.25  # share of the parallel downloads kept for live windows
 
 
 # task parameters
 jobs = 3
+attempts = 3  # attempts per window before it goes to the dead-letter queue
+per_host = 8  # concurrent requests to the data service
 freqmin = 0.1
 freqmax = 49.9
 resampling_rate = 100  # resample rate, in Hz
 outpath = Path("./download")
 logpath = Path("./log")
+metapath = Path("./metadata")  # station metadata cache, refreshed weekly
 
 stations = [
     "RF926",
@@ -52,38 +62,25 @@ stations = [
 
 
 # %%
-def get_to_do_times(total_times, finished_times):
-    to_do_times = sorted(list(set(total_times) - set(finished_times)))[0]
-    return to_do_times
-
-
-def get_finished_times(to_do_times, finished_times):
-    finished_times = finished_times + [to_do_times]
-    return finished_times
-
-
-def pre_task(stations):
-    #  obspy download metadata, would be better to use a local file which is downloaded in advance
+def pre_task(inventory, stations, times):
+    # metadata from the on-disk cache, failed stations are retried later
     metadata_all = []
-    client = Client("RASPISHAKE")
     for i in range(0, len(stations)):
-        try:
-            metadata = client.get_stations(
-                network="AM",
-                station=stations[i],
-                location="00",
-                channel="EHZ",
-                level="RESP",
-            )
-            metadata_all.append(metadata)
-        except Exception:
-            metadata_all.append("error")
+        metadata = inventory.get(f"AM.{stations[i]}.00.EHZ", times)
+        metadata_all.append("error" if metadata is None else metadata)
 
     return metadata_all
 
 
-def process(trace, metadata, start_time, end_time, freqmin, freqmax, resampling_rate):
-    if trace != "error" and metadata != "error":
+def process(
+    raw, metadata, start_time, end_time, freqmin, freqmax, resampling_rate, out, row
+):
+    # read the raw samples from and write into shared memory, so that only
+    # the stats and the handles are pickled to the worker
+    if raw != "error" and metadata != "error":
+        stats, samples = raw
+        trace = Trace(data=np.array(samples.open("r")), header=stats)
+
         # remove response
         trace.remove_response(inventory=metadata, output="VEL")
 
@@ -96,32 +93,43 @@ def process(trace, metadata, start_time, end_time, freqmin, freqmax, resampling_
         # trim
         trace.trim(start_time, end_time, pad=True, nearest_sample=True, fill_value=0)
 
-        return trace
+        data = out.open()
+        data[row, :] = trace.data[0 : data.shape[1]]
+        return True
     else:
-        return "error"
+        return False
 
 
 def compute_task(
-    metadata_all, times, freqmin, freqmax, resampling_rate, time_interval, logpath
+    downloader,
+    metadata_all,
+    times,
+    freqmin,
+    freqmax,
+    resampling_rate,
+    time_interval,
+    logpath,
 ):
     # 1. set logger
     logger = get_logger(str(logpath / "s0_download.log"))
 
-    # 2. obspy download data
-    client = Client("RASPISHAKE")
+    # 2. download data of all stations concurrently, into shared memory
+    arena = SharedArrays()
     obspy_trace_all = []
     start_time = UTCDateTime(times)
     end_time = start_time + time_interval
+    bulk = [("AM", sta, "00", "EHZ", start_time, end_time) for sta in stations]
+    streams = downloader.get_waveforms_bulk(bulk)
     for i in range(0, len(stations)):
         try:
-            # get data
-            obspy_stream = client.get_waveforms(
-                "AM", stations[i], "00", "EHZ", start_time, end_time
-            )
+            obspy_stream = streams[i]
+            if isinstance(obspy_stream, Exception):
+                raise obspy_stream
             obspy_stream.merge(fill_value=0)
 
             # append
-            obspy_trace_all.append(obspy_stream[0])
+            trace = obspy_stream[0]
+            obspy_trace_all.append((trace.stats, arena.share(trace.data)))
 
             # log
             logger.info(f"Success download: {stations[i]} {start_time}")
@@ -129,12 +137,14 @@ def compute_task(
             obspy_trace_all.append("error")
             logger.info(f"Error download: {stations[i]} {start_time}")
 
-    # 3. process
+    # 3. process, into a matrix shared with the workers
+    npts = int(time_interval * resampling_rate)
+    out = arena.empty((len(stations), npts))
     try:
         if jobs == 1:
-            obspy_process_trace_all = []
+            processed = []
             for i in range(0, len(obspy_trace_all)):
-                tr = process(
+                ok = process(
                     obspy_trace_all[i],
                     metadata_all[i],
                     start_time,
@@ -142,10 +152,12 @@ def compute_task(
                     freqmin,
                     freqmax,
                     resampling_rate,
+                    out,
+                    i,
                 )
-                obspy_process_trace_all.append(tr)
+                processed.append(ok)
         elif jobs > 1:
-            obspy_process_trace_all = Parallel(n_jobs=jobs, backend="loky")(
+            processed = Parallel(n_jobs=jobs, backend="loky")(
                 delayed(process)(
                     obspy_trace_all[i],
                     metadata_all[i],
@@ -154,6 +166,8 @@ def compute_task(
                     freqmin,
                     freqmax,
                     resampling_rate,
+                    out,
+                    i,
                 )
                 for i in range(0, len(obspy_trace_all))
             )
@@ -162,13 +176,12 @@ def compute_task(
 
         logger.info(f"Success process: {start_time}")
     except Exception:
-        obspy_process_trace_all = ["error"] * len(stations)
+        processed = [False] * len(stations)
         logger.exception(f"Error process: {start_time}")
 
     # 4. convert to shakecore
     try:
-        npts = int(time_interval * resampling_rate)
-        data = np.zeros((len(stations), npts))
+        data = arena.open(out)
         stream = Stream(
             data,
             header={
@@ -181,10 +194,8 @@ def compute_task(
         )
         for i in range(0, len(stations)):
             # set data
-            if obspy_process_trace_all[i] == "error":
+            if not processed[i]:
                 stream.data[i, :] = np.NaN
-            else:
-                stream.data[i, :] = obspy_process_trace_all[i].data[0:npts]
 
             # set stats
             stream.stats.network[i] = "AM"
@@ -213,36 +224,70 @@ def compute_task(
         logger.info(f"Success write: {start_time}")
     except Exception:
         logger.exception(f"Error write: {start_time}")
+    finally:
+        arena.close()
 
 
 # main function
 if __name__ == "__main__":
     # thread-1: file monitor
-    observer, event_handler = time_monitor(starttime, time_interval, time_lagging)
+    observer, event_handler = time_monitor(
+        starttime,
+        time_interval,
+        time_lagging,
+        max_in_flight=windows,
+        live_windows=live_windows,
+        live_share=live_share,
+    )
     observer.start()
 
     # thread-2: compute jobs
     try:
         outpath.mkdir(parents=True, exist_ok=True)
         logpath.mkdir(parents=True, exist_ok=True)
-        total_times = event_handler.times
-        finished_times = []
-        metadata_all = pre_task(stations)
-        while True:
-            time.sleep(1)
-            if len(total_times) > len(finished_times):
-                to_do_times = get_to_do_times(total_times, finished_times)
-                print(f"Start: {to_do_times}")
+        inventory = InventoryCache(metapath, "RASPISHAKE")
+        inventory.start()
+        downloader = FDSNDownloader("RASPISHAKE", workers=per_host, per_host=per_host)
+        retry = RetryPolicy(max_attempts=attempts, backoff=60)
+        dead_letter = DeadLetterQueue(logpath / "s0_download_dead_letter.jsonl")
+        failures = {}
+
+        def run(times):
+            print(f"Start: {times}")
+            try:
+                metadata_all = pre_task(inventory, stations, times)
                 compute_task(
+                    downloader,
                     metadata_all,
-                    to_do_times,
+                    times,
                     freqmin,
                     freqmax,
                     resampling_rate,
                     time_interval,
                     logpath,
                 )
-                finished_times = get_finished_times(to_do_times, finished_times)
+            except Exception as error:
+                get_logger(str(logpath / "s0_download.log")).exception(
+                    f"Error window: {times}"
+                )
+                attempt = failures.get(str(times), 0) + 1
+                if retry.should_retry(attempt, error):
+                    # hand the window back after a backoff, not in a busy loop
+                    failures[str(times)] = attempt
+                    timer = threading.Timer(
+                        retry.delay(attempt), event_handler.release, ([times],)
+                    )
+                    timer.daemon = True
+                    timer.start()
+                    return
+                dead_letter.add(times, error, attempt)
+            failures.pop(str(times), None)
+            event_handler.ack([times])
+
+        with ThreadPoolExecutor(max_workers=windows) as pool:
+            while True:
+                for times in event_handler.get_batch(windows):
+                    pool.submit(run, times)
 
     except KeyboardInterrupt:
         observer.stop()
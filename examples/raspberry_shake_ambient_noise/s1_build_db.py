@@ -1,6 +1,5 @@
 # %%
 import sys
-import time
 from pathlib import Path
 
 sys.path.append("/Users/yinfu/ohmyshake/shakecore")
@@ -8,15 +7,20 @@ sys.path.append("/Users/yinfu/ohmyshake/shakeflow")
 
 import shakecore as sc
 from shakeflow import file_monitor, get_logger
+from shakeflow.watchdog import TimeWindows
 
 
 # watchdog parameters
-n_files = 3  # at least 'n_files' to start computing
 path = (
     "/Users/yinfu/ohmyshake/shakeflow/examples/raspberry_shake_ambient_noise/download"
 )
 mode = "from_origin"
 suffix = ".h5"
+resume = True  # skip files finished before a restart
+time_format = "%Y_%m_%d_%H_%M_%S_%f_EHZ.h5"  # file names, in UTC
+file_length = 60 * 10  # time span of one input file, in seconds
+window_length = 60 * 30  # time span to merge and compute at once, in seconds
+window_wait = 60 * 60  # how long to wait for a missing file, in seconds
 
 # task parameters
 outpath = Path("./database")
@@ -24,16 +28,6 @@ logpath = Path("./log")
 
 
 # %%
-def get_to_do_files(total_files, finished_files, n_files):
-    to_do_files = sorted(list(set(total_files) - set(finished_files)))[0:n_files]
-    return to_do_files
-
-
-def get_finished_files(to_do_files, finished_files):
-    finished_files = finished_files + to_do_files
-    return finished_files
-
-
 def compute_task(files, logpath):
     # 1. set logger
     logger = get_logger(str(logpath / "s1_build_db.log"))
@@ -61,22 +55,26 @@ def compute_task(files, logpath):
 # main function
 if __name__ == "__main__":
     # thread-1: file monitor
-    observer, event_handler = file_monitor(path, mode=mode, suffix=suffix)
+    observer, event_handler = file_monitor(
+        path, mode=mode, suffix=suffix, resume=resume, stage="s1_build_db"
+    )
     observer.start()
 
     # thread-2: compute jobs
     try:
         outpath.mkdir(parents=True, exist_ok=True)
         logpath.mkdir(parents=True, exist_ok=True)
-        total_files = event_handler.files
-        finished_files = []
+        windows = TimeWindows(
+            event_handler.queue, time_format, file_length, window_length, window_wait
+        )
         while True:
-            time.sleep(1)
-            if (len(total_files) - len(finished_files)) >= n_files:
-                to_do_files = get_to_do_files(total_files, finished_files, n_files)
-                print(f"Start: {to_do_files}")
-                compute_task(to_do_files, logpath)
-                finished_files = get_finished_files(to_do_files, finished_files)
+            window = windows.get()
+            if window.complete:
+                print(f"Start: {window.files}")
+                compute_task(window.files, logpath)
+            else:
+                print(f"Skip incomplete window: {window.files}")
+            windows.ack(window)
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
@@ -1,6 +1,5 @@
 # %%
 import sys
-import time
 import numpy as np
 from pathlib import Path
 from obspy.geodetics import locations2degrees
@@ -12,18 +11,27 @@ sys.path.append("/Users/yinfu/ohmyshake/shakeflow")
 
 import noisecc as nc
 import shakecore as sc
-from shakeflow import file_monitor, get_logger
+from shakeflow import file_monitor, get_logger, TaskExecutor
+from shakeflow.pipeline import DeadLetterQueue, RetryPolicy
+from shakeflow.watchdog import TimeWindows
 
 
 # watchdog parameters
-n_files = 2  # at least 'n_files' to start computing
 path = (
     "/Users/yinfu/ohmyshake/shakeflow/examples/raspberry_shake_ambient_noise/database"
 )
 mode = "from_origin"
 suffix = ".h5"
+resume = True  # skip files finished before a restart
+time_format = "%Y_%m_%d_%H_%M_%S_%f_EHZ.h5"  # file names, in UTC
+file_length = 60 * 30  # time span of one input file, in seconds
+window_length = 60 * 60  # time span to merge and compute at once, in seconds
+window_wait = 60 * 60  # how long to wait for a missing file, in seconds
 
 # task parameters
+tasks = 2  # number of windows computed concurrently
+attempts = 3  # attempts per window before it goes to the dead-letter queue
+memory_budget = 8 * 2**30  # memory of all running windows, in bytes
 jobs = 2
 outpath = Path("./results")
 logpath = Path("./log")
@@ -62,17 +70,7 @@ median_low = 0.5  # Float64; min median value (default value)
 
 
 # %%
-def get_to_do_files(total_files, finished_files, n_files):
-    to_do_files = sorted(list(set(total_files) - set(finished_files)))[0:n_files]
-    return to_do_files
-
-
-def get_finished_files(to_do_files, finished_files):
-    finished_files = finished_files + to_do_files
-    return finished_files
-
-
-def compute_task(files, logpath, jobs):
+def compute_task(files, logpath=logpath, jobs=jobs):
     # 1. set logger
     logger = get_logger(str(logpath / "s2_cc_stack.log"))
 
@@ -194,30 +192,45 @@ def compute_task(files, logpath, jobs):
         logger.info(f"Success: {files}")
     except Exception:
         logger.exception(f"Error: {files}")
+        raise
 
 
 # main function
 if __name__ == "__main__":
     # thread-1: file monitor
-    observer, event_handler = file_monitor(path, mode=mode, suffix=suffix)
+    observer, event_handler = file_monitor(
+        path, mode=mode, suffix=suffix, resume=resume, stage="s2_cc_stack"
+    )
     observer.start()
 
     # thread-2: compute jobs
+    executor = TaskExecutor(
+        compute_task,
+        workers=tasks,
+        memory_budget=memory_budget,  # per-window memory is learned from peak RSS
+        on_done=lambda files, result: event_handler.queue.ack(files),
+        retry=RetryPolicy(max_attempts=attempts, backoff=60),
+        # replay with: python -m shakeflow.pipeline replay <file> s2_cc_stack:compute_task
+        dead_letter=DeadLetterQueue(logpath / "s2_cc_stack_dead_letter.jsonl"),
+    )
     try:
         (outpath / "cc").mkdir(parents=True, exist_ok=True)
         (outpath / "stack").mkdir(parents=True, exist_ok=True)
         logpath.mkdir(parents=True, exist_ok=True)
-        total_files = event_handler.files
-        finished_files = []
+        windows = TimeWindows(
+            event_handler.queue, time_format, file_length, window_length, window_wait
+        )
         while True:
-            time.sleep(1)
-            if (len(total_files) - len(finished_files)) >= n_files:
-                to_do_files = get_to_do_files(total_files, finished_files, n_files)
-                print(f"Start: {to_do_files}")
-                compute_task(to_do_files, logpath, jobs)
-                finished_files = get_finished_files(to_do_files, finished_files)
+            window = windows.get()
+            if window.complete:
+                print(f"Start: {window.files}")
+                executor.submit(window.files, logpath, jobs)
+            else:
+                print(f"Skip incomplete window: {window.files}")
+                windows.ack(window)
     except KeyboardInterrupt:
         observer.stop()
+        executor.shutdown()
     observer.join()
 
 # %%
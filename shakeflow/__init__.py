@@ -1,5 +1,6 @@
 from shakeflow.watchdog import file_monitor, time_monitor
 from shakeflow.utils import simulator, get_logger
+from shakeflow.pipeline import Pipeline, TaskExecutor
 
 __version__ = "0.0.2"
 
@@ -0,0 +1,2 @@
+from .fdsn import FDSNDownloader
+from .inventory import InventoryCache
@@ -0,0 +1,264 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+
+from obspy import UTCDateTime, read_inventory
+from obspy.clients.fdsn import Client
+
+
+class InventoryCache:
+    """On-disk cache of station metadata with instrument responses.
+
+    The StationXML of each channel, keyed by its SEED id
+    ``network.station.location.channel``, is kept in a file, and an SQLite
+    index records the validity epochs of its channels, so that :meth:`get`
+    picks the response valid at a given time. Once fetched, metadata is
+    served from disk and memory without contacting the service, and a
+    background thread started by :meth:`start` refreshes entries older than
+    ``ttl``. Stale entries are served meanwhile. Channels whose download
+    failed are retried after ``retry`` seconds, doubling up to ``ttl``,
+    instead of being dropped for the whole run. Refresh times are jittered,
+    so that many pipelines restarted at once do not query the service
+    together.
+
+    Parameters
+    ----------
+    path : str
+        The cache directory, created if missing.
+    base_url : str
+        An ObsPy client key such as "RASPISHAKE", or the URL of the service.
+    ttl : int or float
+        The age after which an entry is refreshed, in seconds.
+    retry : int or float
+        The delay before retrying a failed channel, in seconds.
+    level : str
+        The StationXML level requested, "response" by default.
+    timeout : int or float
+        The timeout of one request, in seconds.
+    """
+
+    def __init__(
+        self,
+        path,
+        base_url="RASPISHAKE",
+        ttl=7 * 24 * 3600,
+        retry=600,
+        level="response",
+        timeout=60,
+    ):
+        self.path = str(path)
+        self.base_url = base_url
+        self.ttl = ttl
+        self.retry = retry
+        self.level = level
+        self.timeout = timeout
+        os.makedirs(self.path, exist_ok=True)
+        self._client = None
+        self._loaded = {}
+        self._fetching = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, "index.db"),
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS epochs ("
+            "seed_id TEXT, starttime REAL, endtime REAL, fetched REAL, "
+            "PRIMARY KEY (seed_id, starttime))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            "seed_id TEXT PRIMARY KEY, failed REAL, attempts INTEGER, error TEXT)"
+        )
+
+    def _file(self, seed_id):
+        return os.path.join(self.path, seed_id + ".xml")
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def get(self, seed_id, time=None):
+        """
+        Return the metadata of a channel valid at ``time``.
+
+        A channel that is not cached is fetched at once, unless its last
+        attempt failed less than the retry delay ago.
+
+        Parameters
+        ----------
+        seed_id : str
+            ``network.station.location.channel``, e.g. "AM.RF926.00.EHZ".
+        time : obspy.UTCDateTime
+            The time the epoch must cover. Defaults to now.
+
+        Returns
+        -------
+        inventory : obspy.Inventory
+            The channel epoch, or None if it is unknown or unavailable.
+        """
+        t = UTCDateTime(time).timestamp if time is not None else UTCDateTime().timestamp
+        if not self._query("SELECT 1 FROM epochs WHERE seed_id = ?", (seed_id,)):
+            if not self._due(seed_id) or not self.fetch(seed_id):
+                return None
+        rows = self._query(
+            "SELECT fetched FROM epochs WHERE seed_id = ? "
+            "AND starttime <= ? AND ? < endtime",
+            (seed_id, t, t),
+        )
+        if not rows:
+            return None
+        return self._load(seed_id, rows[0][0]).select(time=UTCDateTime(t))
+
+    def get_many(self, seed_ids, time=None):
+        """Return :meth:`get` for several channels, as a list."""
+        return [self.get(seed_id, time) for seed_id in seed_ids]
+
+    def _load(self, seed_id, fetched):
+        with self._lock:
+            loaded = self._loaded.get(seed_id)
+        if loaded is None or loaded[0] != fetched:
+            loaded = (fetched, read_inventory(self._file(seed_id), format="STATIONXML"))
+            with self._lock:
+                self._loaded[seed_id] = loaded
+        return loaded[1]
+
+    def _due(self, seed_id):
+        """Whether a failed channel may be tried again."""
+        rows = self._query(
+            "SELECT failed, attempts FROM failures WHERE seed_id = ?", (seed_id,)
+        )
+        if not rows:
+            return True
+        failed, attempts = rows[0]
+        delay = min(self.retry * 2 ** (attempts - 1), self.ttl)
+        return time.time() >= failed + delay
+
+    def fetch(self, seed_id):
+        """
+        Download the metadata of a channel and store it.
+
+        Concurrent fetches of the same channel wait for a single download.
+
+        Returns
+        -------
+        fetched : bool
+            False if the download failed, which is recorded for a retry.
+        """
+        with self._lock:
+            event = self._fetching.get(seed_id)
+            owner = event is None
+            if owner:
+                event = self._fetching[seed_id] = threading.Event()
+        if not owner:
+            event.wait()
+            return not self._query(
+                "SELECT 1 FROM failures WHERE seed_id = ?", (seed_id,)
+            )
+        try:
+            return self._fetch(seed_id)
+        finally:
+            with self._lock:
+                del self._fetching[seed_id]
+            event.set()
+
+    def _fetch(self, seed_id):
+        network, station, location, channel = seed_id.split(".")
+        try:
+            if self._client is None:
+                self._client = Client(self.base_url, timeout=self.timeout)
+            inventory = self._client.get_stations(
+                network=network,
+                station=station,
+                location=location,
+                channel=channel,
+                level=self.level,
+            )
+        except Exception as error:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO failures VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT (seed_id) DO UPDATE SET "
+                    "failed = excluded.failed, attempts = attempts + 1, "
+                    "error = excluded.error",
+                    (seed_id, time.time(), f"{type(error).__name__}: {error}"),
+                )
+            return False
+
+        tmp = self._file(seed_id) + ".tmp"
+        inventory.write(tmp, format="STATIONXML")
+        os.replace(tmp, self._file(seed_id))
+        # jitter the age so that entries fetched together expire apart
+        fetched = time.time() - random.uniform(0, 0.1) * self.ttl
+        epochs = [
+            (
+                seed_id,
+                cha.start_date.timestamp if cha.start_date else float("-inf"),
+                cha.end_date.timestamp if cha.end_date else float("inf"),
+                fetched,
+            )
+            for net in inventory
+            for sta in net
+            for cha in sta
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM epochs WHERE seed_id = ?", (seed_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?)", epochs
+            )
+            self._conn.execute("DELETE FROM failures WHERE seed_id = ?", (seed_id,))
+            self._conn.execute("COMMIT")
+            self._loaded.pop(seed_id, None)
+        return True
+
+    def stale(self):
+        """The channels due for a refresh or a retry."""
+        expired = self._query(
+            "SELECT DISTINCT seed_id FROM epochs WHERE fetched <= ?",
+            (time.time() - self.ttl,),
+        )
+        failed = self._query("SELECT seed_id FROM failures")
+        ids = dict.fromkeys(row[0] for row in expired + failed)
+        # a refresh that failed keeps its entry served until it is due again
+        return [seed_id for seed_id in ids if self._due(seed_id)]
+
+    def refresh(self):
+        """Refresh every stale or failed channel, returning the number done."""
+        return sum(self.fetch(seed_id) for seed_id in self.stale())
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            self.refresh()
+
+    def start(self, interval=None):
+        """
+        Refresh stale and failed channels from a daemon thread.
+
+        Parameters
+        ----------
+        interval : int or float
+            The time between two checks, in seconds. Defaults to ``retry``.
+        """
+        if self._thread is None:
+            interval = interval if interval is not None else self.retry
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._conn.close()
@@ -31,7 +31,7 @@ app.layout = html.Div(
     Output("file-change-output", "children"), Input("interval-component", "n_intervals")
 )
 def update_output(n):
-    print(n, event_handler.files[-1])
+    print(n, event_handler.queue.last)
     return f"current time: {n}"
 
 
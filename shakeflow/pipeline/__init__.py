@@ -0,0 +1,5 @@
+from .pipeline import Pipeline, Stage
+from .executor import TaskExecutor
+from .retry import DeadLetterQueue, RetryPolicy
+from .cache import ResultCache, cache_key, identity
+from .memory import FootprintEstimator, MemoryBudget
@@ -0,0 +1,44 @@
+import os
+import sys
+import argparse
+import importlib
+
+from .retry import DeadLetterQueue
+
+
+def _load(spec):
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError("function must be given as 'module:function'")
+    sys.path.insert(0, os.getcwd())
+    return getattr(importlib.import_module(module), name)
+
+
+def main(argv=None):
+    """Inspect and replay a dead-letter queue from the command line.
+
+    python -m shakeflow.pipeline list dead_letter.jsonl
+    python -m shakeflow.pipeline replay dead_letter.jsonl s2_cc_stack:task
+    python -m shakeflow.pipeline clear dead_letter.jsonl
+    """
+    parser = argparse.ArgumentParser(prog="python -m shakeflow.pipeline")
+    parser.add_argument("command", choices=["list", "replay", "clear"])
+    parser.add_argument("path", help="the dead-letter queue file")
+    parser.add_argument("function", nargs="?", help="'module:function' to replay")
+    args = parser.parse_args(argv)
+
+    dead_letter = DeadLetterQueue(args.path)
+    if args.command == "list":
+        for entry in dead_letter.entries():
+            print(f"{entry['attempts']} {entry['inputs']} {entry['error']}")
+    elif args.command == "clear":
+        dead_letter.clear()
+    else:
+        if args.function is None:
+            parser.error("replay needs a 'module:function'")
+        succeeded, failed = dead_letter.replay(_load(args.function))
+        print(f"replayed: {succeeded} succeeded, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
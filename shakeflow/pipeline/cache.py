@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import sqlite3
+import threading
+
+
+def identity(item):
+    """
+    A JSON-serializable identity of a stage input.
+
+    Paths of existing files are identified by ``(path, size, mtime_ns)``, so
+    a rewritten file changes the identity while a touched directory does not.
+    Lists, tuples and dicts are identified element by element, and any other
+    value, e.g. ``UTCDateTime``, by its string.
+    """
+    if isinstance(item, (str, os.PathLike)) and os.path.isfile(item):
+        st = os.stat(item)
+        return [os.fspath(item), st.st_size, st.st_mtime_ns]
+    if isinstance(item, (list, tuple)):
+        return [identity(x) for x in item]
+    if isinstance(item, dict):
+        return {str(k): identity(v) for k, v in item.items()}
+    if item is None or isinstance(item, (bool, int, float)):
+        return item
+    return str(item)
+
+
+def cache_key(*parts):
+    """The SHA-256 hex digest of JSON-serializable parts."""
+    text = json.dumps(parts, default=str, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed store of stage outputs on disk.
+
+    Outputs are pickled into one file per key, and an SQLite index records
+    their sizes and last access, so that the least recently used outputs are
+    evicted once the cache grows beyond ``max_bytes``. Keys are normally made
+    by :func:`cache_key` from the identity of the inputs and the parameters
+    of a stage, so a changed input or parameter simply misses.
+
+    Parameters
+    ----------
+    path : str
+        The cache directory, created if missing.
+    max_bytes : int
+        The largest total size of the stored outputs. None is unbounded.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, "index.db"),
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, size INTEGER, atime REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)"
+        )
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".pkl")
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and os.path.exists(self._file(key))
+
+    def get(self, key, default=None):
+        """Return the output stored under ``key``, or ``default``."""
+        try:
+            with open(self._file(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key)
+            )
+        return value
+
+    def put(self, key, value):
+        """Store an output under ``key``, evicting old outputs if needed."""
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, os.path.getsize(file), time.time()),
+            )
+        self.evict()
+
+    def forget(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def size(self):
+        """The total size of the stored outputs, in bytes."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """Drop the least recently used outputs above ``max_bytes``."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return
+        excess = self.size - max_bytes
+        if excess <= 0:
+            return
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY atime"
+            ).fetchall()
+        for key, size in rows:
+            if excess <= 0:
+                break
+            self.forget(key)
+            excess -= size
+
+    def clear(self):
+        self.evict(0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
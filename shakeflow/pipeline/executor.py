@@ -0,0 +1,276 @@
+import os
+import time
+import logging
+import warnings
+import threading
+import itertools
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .memory import FootprintEstimator, MemoryBudget, measured
+
+logger = logging.getLogger(__name__)
+
+
+def _key(inputs):
+    return tuple(inputs) if isinstance(inputs, list) else inputs
+
+
+class TaskExecutor:
+    """Run tasks concurrently in a persistent process pool, committing in order.
+
+    Tasks are submitted with their inputs, typically a batch claimed from a
+    file queue or a time window. While a task runs its inputs are tracked as
+    in-flight, so they are not submitted twice. Tasks may finish in any order,
+    but ``on_done`` is called in submission order, so a consumer that submits
+    in time order also commits its finished state in time order.
+
+    Parameters
+    ----------
+    func : callable
+        The task function, called as ``func(inputs, *args, **kwargs)`` in a
+        worker process. It must be picklable, i.e. defined at module level.
+    workers : int
+        The number of worker processes. Defaults to the number of CPUs.
+    on_done : callable
+        Called as ``on_done(inputs, result)`` for each task, in order, from
+        a thread of the pool. It should be quick and must not call
+        :meth:`submit`. Exceptions it raises are logged, and the task counts
+        as committed.
+    on_error : callable
+        Called as ``on_error(inputs, exception)`` for failed tasks, in order.
+        If None, failed tasks go to ``on_done`` with a None result.
+    max_pending : int
+        The largest number of submitted but uncommitted tasks, above which
+        :meth:`submit` blocks. Defaults to twice the number of workers.
+    retry : RetryPolicy
+        The default retry policy of failed tasks. None fails at once.
+    dead_letter : DeadLetterQueue
+        If given, the inputs of tasks that fail for good are recorded in it,
+        before ``on_error`` is called.
+    mp_context : multiprocessing.context.BaseContext
+        The start method of the worker processes.
+    memory_budget : int or MemoryBudget
+        If given, tasks only start while their estimated memory fits in this
+        budget, in bytes. Share one :class:`MemoryBudget` between the
+        executors of several stages to pack them on one node.
+    memory : int or callable
+        The memory of one task in bytes, or ``memory(inputs) -> bytes`` for
+        tasks whose footprint depends on their inputs. If None, it is learned
+        from the peak RSS of the previous tasks, and the first task runs
+        alone. Peak RSS is measured per task on Linux, and elsewhere, e.g. on
+        macOS, from the growth of the peak RSS of each worker process, which
+        only sees how far a task exceeds an earlier peak. Where nothing can
+        be measured, a warning is issued and every task keeps reserving the
+        whole budget, so declare ``memory`` there.
+    """
+
+    def __init__(
+        self,
+        func,
+        workers=None,
+        on_done=None,
+        on_error=None,
+        max_pending=None,
+        retry=None,
+        dead_letter=None,
+        mp_context=None,
+        memory_budget=None,
+        memory=None,
+    ):
+        self.func = func
+        self.retry = retry
+        self.dead_letter = dead_letter
+        self.on_done = on_done
+        self.on_error = on_error
+        self.workers = workers or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=mp_context)
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self.max_pending = max_pending or 2 * self.workers
+        if memory_budget is not None and not isinstance(memory_budget, MemoryBudget):
+            memory_budget = MemoryBudget(memory_budget)
+        self.memory_budget = memory_budget
+        self.memory = memory
+        if memory_budget is not None:
+            self.footprints = FootprintEstimator(memory_budget.total)
+        self._unmeasured = 0
+        self._in_flight = {}
+        self._finished = {}
+        self._counter = itertools.count()
+        self._next_commit = 0
+        self._cond = threading.Condition(threading.RLock())
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def __contains__(self, inputs):
+        return _key(inputs) in self._in_flight
+
+    def submit(self, inputs, *args, timeout=None, retry=None, memory=None, **kwargs):
+        """
+        Submit a task, waiting while ``max_pending`` tasks are uncommitted.
+
+        With a ``memory_budget``, it also waits until the memory of the task
+        fits in the budget.
+
+        Parameters
+        ----------
+        inputs : object
+            The inputs of the task, passed first to ``func``.
+        *args, **kwargs
+            Further arguments of ``func``.
+        timeout : int or float
+            The longest wait for a free slot, in seconds.
+        retry : RetryPolicy
+            The retry policy of this task, instead of the default one.
+        memory : int
+            The memory of this task in bytes, instead of the estimate.
+
+        Returns
+        -------
+        submitted : bool
+            False if the inputs are already in flight or the timeout expired.
+        """
+        key = _key(inputs)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if key in self._in_flight:
+                return False
+        size = self._footprint(inputs, memory)
+        if size and not self.memory_budget.acquire(size, timeout):
+            return False
+        with self._cond:
+            if timeout is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            if key in self._in_flight or not self._cond.wait_for(
+                lambda: len(self._in_flight) < self.max_pending, timeout
+            ):
+                if size:
+                    self.memory_budget.release(size)
+                return False
+            seq = next(self._counter)
+            self._in_flight[key] = seq
+        task = (seq, inputs, args, kwargs, retry or self.retry, size)
+        self._launch(task, 1)
+        return True
+
+    def _footprint(self, inputs, memory):
+        """The memory reserved for a task, or 0 without a budget."""
+        if self.memory_budget is None:
+            return 0
+        if memory is None:
+            memory = self.memory
+        if callable(memory):
+            memory = memory(inputs)
+        if memory is None:
+            memory = self.footprints.estimate()
+        return max(int(memory), 1)
+
+    def _submit(self, *args, **kwargs):
+        with self._pool_lock:
+            pool = self.pool
+        try:
+            return pool.submit(*args, **kwargs)
+        except BrokenProcessPool:
+            # a worker died, e.g. killed for memory, so start a new pool
+            with self._pool_lock:
+                if self._closed:
+                    raise
+                if self.pool is pool:
+                    pool.shutdown(wait=False)
+                    self.pool = ProcessPoolExecutor(
+                        self.workers, mp_context=self.mp_context
+                    )
+                pool = self.pool
+            return pool.submit(*args, **kwargs)
+
+    def _launch(self, task, attempt):
+        seq, inputs, args, kwargs, _, size = task
+        try:
+            if size:
+                future = self._submit(measured, self.func, inputs, *args, **kwargs)
+            else:
+                future = self._submit(self.func, inputs, *args, **kwargs)
+        except Exception as error:
+            # fail the attempt instead of leaving the task uncommitted
+            future = Future()
+            future.set_exception(error)
+        future.add_done_callback(lambda f: self._attempted(task, attempt, f))
+
+    def _relaunch(self, task, attempt):
+        size = task[-1]
+        if size:
+            self.memory_budget.acquire(size)
+        self._launch(task, attempt)
+
+    def _attempted(self, task, attempt, future):
+        seq, inputs, _, _, retry, size = task
+        if size:
+            self.memory_budget.release(size)
+        error = future.exception()
+        result = None
+        if error is None:
+            result = future.result()
+            if size:
+                result, footprint = result
+                self.footprints.add(footprint)
+                self._check_footprints(footprint)
+        else:
+            if retry is not None and retry.should_retry(attempt, error):
+                timer = threading.Timer(
+                    retry.delay(attempt), self._relaunch, (task, attempt + 1)
+                )
+                timer.daemon = True
+                timer.start()
+                return
+            if self.dead_letter is not None:
+                self.dead_letter.add(inputs, error, attempt)
+        self._complete(seq, inputs, result, error)
+
+    def _check_footprints(self, footprint):
+        if footprint is not None or len(self.footprints):
+            return
+        self._unmeasured += 1
+        if self._unmeasured == self.workers:
+            warnings.warn(
+                "the memory of tasks cannot be measured here, so each task "
+                "reserves the whole memory_budget; pass memory= to declare it",
+                RuntimeWarning,
+            )
+
+    def _complete(self, seq, inputs, result, error):
+        with self._cond:
+            self._finished[seq] = (inputs, result, error)
+            while self._next_commit in self._finished:
+                inputs, result, error = self._finished.pop(self._next_commit)
+                self._next_commit += 1
+                try:
+                    self._commit(inputs, result, error)
+                except Exception:
+                    # keep committing the tasks that finished behind this one
+                    logger.exception("Error committing the task of %r", inputs)
+                finally:
+                    self._in_flight.pop(_key(inputs), None)
+                    self._cond.notify_all()
+
+    def _commit(self, inputs, result, error):
+        if error is None:
+            if self.on_done is not None:
+                self.on_done(inputs, result)
+        elif self.on_error is not None:
+            self.on_error(inputs, error)
+        elif self.on_done is not None:
+            self.on_done(inputs, None)
+
+    def join(self, timeout=None):
+        """Wait until every submitted task is committed."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._in_flight, timeout)
+
+    def shutdown(self, wait=True):
+        with self._pool_lock:
+            self._closed = True
+            pool = self.pool
+        pool.shutdown(wait=wait)
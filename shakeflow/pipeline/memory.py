@@ -0,0 +1,131 @@
+import sys
+import threading
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _status(field):
+    """A field of /proc/self/status in bytes, or None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak():
+    """Reset the peak RSS of this process, if the kernel allows it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _maxrss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measured(func, *args, **kwargs):
+    """
+    Call ``func`` and measure the memory it took on top of the process.
+
+    On Linux the peak RSS is reset before the call, and the footprint is the
+    peak during the call minus the RSS before it. Elsewhere, e.g. on macOS,
+    and where the reset is not allowed, only the growth of the peak RSS of
+    the process is seen. That measures the first tasks of a worker process
+    closely, while later tasks that stay below an earlier peak give None.
+
+    Returns
+    -------
+    result : object
+        The result of ``func``.
+    footprint : int
+        The memory of the call in bytes, or None if it cannot be measured.
+    """
+    before = _status("VmRSS")
+    if before is not None and _reset_peak():
+        result = func(*args, **kwargs)
+        peak = _status("VmHWM")
+        return result, None if peak is None else max(peak - before, 0)
+    before = _maxrss()
+    result = func(*args, **kwargs)
+    after = _maxrss()
+    if before is None or after is None or after <= before:
+        return result, None
+    return result, after - before
+
+
+class MemoryBudget:
+    """Memory shared by the tasks of one or more executors on a node.
+
+    Tasks reserve their estimated footprint before they start and give it
+    back when they finish, so the sum of the reservations stays within
+    ``total``. A task larger than the whole budget waits until it can run
+    alone. Share one budget between the executors of several stages to pack
+    them densely on one node.
+
+    Parameters
+    ----------
+    total : int
+        The memory available to the tasks, in bytes.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.used = 0
+        self._cond = threading.Condition()
+
+    @property
+    def available(self):
+        return self.total - self.used
+
+    def acquire(self, size, timeout=None):
+        """Reserve ``size`` bytes, waiting up to ``timeout`` seconds."""
+        size = min(size, self.total)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.available >= size, timeout):
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._cond:
+            self.used -= min(size, self.total)
+            self._cond.notify_all()
+
+
+class FootprintEstimator:
+    """Estimate the memory of the next task from the last ones.
+
+    The estimate is the largest of the last ``history`` footprints times
+    ``margin``. Before any footprint is known it is ``default``.
+    """
+
+    def __init__(self, default, history=20, margin=1.2):
+        self.default = default
+        self.margin = margin
+        self._footprints = deque(maxlen=history)
+
+    def __len__(self):
+        return len(self._footprints)
+
+    def add(self, footprint):
+        if footprint is not None:
+            self._footprints.append(footprint)
+
+    def estimate(self):
+        if not self._footprints:
+            return self.default
+        return int(max(self._footprints) * self.margin)
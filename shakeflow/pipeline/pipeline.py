@@ -0,0 +1,189 @@
+import functools
+from collections import namedtuple
+
+from .cache import cache_key, identity
+
+Stage = namedtuple("Stage", ["name", "func", "inputs", "persist", "params", "cache"])
+
+_MISSING = object()
+
+
+def _describe(func):
+    if isinstance(func, functools.partial):
+        return [_describe(func.func), identity(func.args), identity(func.keywords)]
+    name = getattr(func, "__qualname__", type(func).__qualname__)
+    return f"{getattr(func, '__module__', None)}.{name}"
+
+
+class Pipeline:
+    """A DAG of stages that hand their outputs to each other in memory.
+
+    Each stage is a function. Stages without inputs receive the item given to
+    :meth:`run`, e.g. a time window, and the other stages receive the outputs
+    of their input stages as positional arguments, in the order of
+    ``inputs``. Intermediate outputs are dropped as soon as their last
+    consumer has run, and writing them to disk is an optional side output of
+    a stage instead of the way stages communicate.
+
+    With a ``cache``, the output of each stage is stored under a key made of
+    the identity of the item (file paths by size and mtime), the parameters
+    of the stage and the keys of its inputs. Stages whose key is cached are
+    skipped, together with the upstream stages only they need, so after a
+    parameter change only the changed stage and those downstream of it run
+    again.
+
+    Parameters
+    ----------
+    cache : ResultCache
+        The store of stage outputs. None disables caching.
+
+    Examples
+    --------
+    >>> pipe = Pipeline()
+    >>> pipe.add("download", download)
+    >>> pipe.add("process", process, inputs=["download"], persist=write_h5)
+    >>> pipe.add("cc", cross_correlate, inputs=["process"])
+    >>> results = pipe.run(starttime)
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.stages = {}
+        self._order = None
+
+    def add(self, name, func, inputs=(), persist=None, params=None, cache=True):
+        """
+        Add a stage.
+
+        Parameters
+        ----------
+        name : str
+            The unique name of the stage.
+        func : callable
+            The function of the stage.
+        inputs : list of str
+            The names of the stages whose outputs are passed to ``func``.
+        persist : callable
+            If given, called as ``persist(output, item)`` after the stage ran,
+            to keep a copy of its output, e.g. as an HDF5 file.
+        params : dict
+            Keyword arguments of ``func``, part of the cache key. Add e.g. a
+            ``version`` entry to invalidate outputs after changing ``func``.
+        cache : bool
+            Whether the outputs of this stage are cached, if the pipeline has
+            a cache. Cheap stages or large outputs may be better recomputed.
+        """
+        if name in self.stages:
+            raise ValueError(f"stage '{name}' already exists")
+        stage = Stage(name, func, tuple(inputs), persist, dict(params or {}), cache)
+        self.stages[name] = stage
+        self._order = None
+        return self
+
+    @property
+    def order(self):
+        """The stage names in topological order."""
+        if self._order is None:
+            for stage in self.stages.values():
+                for name in stage.inputs:
+                    if name not in self.stages:
+                        raise ValueError(f"unknown input '{name}' of '{stage.name}'")
+            order, done = [], set()
+            remaining = list(self.stages.values())
+            while remaining:
+                ready = [s for s in remaining if done.issuperset(s.inputs)]
+                if not ready:
+                    names = [s.name for s in remaining]
+                    raise ValueError(f"stages {names} form a cycle")
+                for stage in ready:
+                    order.append(stage.name)
+                    done.add(stage.name)
+                remaining = [s for s in remaining if s.name not in done]
+            self._order = order
+        return self._order
+
+    def run(self, item, outputs=None):
+        """
+        Run all stages for one item.
+
+        Parameters
+        ----------
+        item : object
+            The input of the stages without inputs.
+        outputs : list of str
+            The stages whose outputs are returned. Defaults to the stages that
+            no other stage consumes.
+
+        Returns
+        -------
+        results : dict
+            The outputs of the requested stages, by name.
+        """
+        order = self.order
+        if outputs is None:
+            consumed = {name for s in self.stages.values() for name in s.inputs}
+            outputs = [name for name in order if name not in consumed]
+        keys = self.keys(item) if self.cache is not None else {}
+
+        # walk back from the outputs, stopping at cached stages
+        values, compute, needed = {}, set(), set(outputs)
+        for name in reversed(order):
+            if name not in needed:
+                continue
+            stage = self.stages[name]
+            if stage.cache and name in keys:
+                value = self.cache.get(keys[name], _MISSING)
+                if value is not _MISSING:
+                    values[name] = value
+                    continue
+            compute.add(name)
+            needed.update(stage.inputs)
+
+        last_use = {}
+        for i, name in enumerate(order):
+            if name in compute:
+                for input_name in self.stages[name].inputs:
+                    last_use[input_name] = i
+
+        for i, name in enumerate(order):
+            if name not in compute:
+                continue
+            stage = self.stages[name]
+            if stage.inputs:
+                args = [values[n] for n in stage.inputs]
+            else:
+                args = [item]
+            value = stage.func(*args, **stage.params)
+            if stage.persist is not None:
+                stage.persist(value, item)
+            if stage.cache and name in keys:
+                self.cache.put(keys[name], value)
+            values[name] = value
+            for input_name in stage.inputs:
+                if last_use[input_name] == i and input_name not in outputs:
+                    del values[input_name]
+
+        return {name: values[name] for name in outputs}
+
+    def keys(self, item):
+        """
+        The cache keys of all stages for one item.
+
+        Parameters
+        ----------
+        item : object
+            The input of the stages without inputs.
+
+        Returns
+        -------
+        keys : dict
+            The key of each stage, by name.
+        """
+        keys, item_id = {}, identity(item)
+        for name in self.order:
+            stage = self.stages[name]
+            upstream = [keys[n] for n in stage.inputs] if stage.inputs else item_id
+            keys[name] = cache_key(
+                name, _describe(stage.func), identity(stage.params), upstream
+            )
+        return keys
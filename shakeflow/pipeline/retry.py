@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import threading
+
+
+class RetryPolicy:
+    """Exponential backoff for failed tasks.
+
+    Parameters
+    ----------
+    max_attempts : int
+        The number of attempts, including the first one.
+    backoff : int or float
+        The delay before the first retry, in seconds.
+    factor : int or float
+        The growth of the delay from one retry to the next.
+    max_backoff : int or float
+        The longest delay, in seconds.
+    retry_on : tuple of type
+        The exception types worth retrying. Others fail at once.
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        backoff=1.0,
+        factor=2.0,
+        max_backoff=300.0,
+        retry_on=(Exception,),
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.retry_on = retry_on
+
+    def should_retry(self, attempt, error):
+        return attempt < self.max_attempts and isinstance(error, self.retry_on)
+
+    def delay(self, attempt):
+        """The delay after the failed attempt number ``attempt`` (from 1)."""
+        return min(self.backoff * self.factor ** (attempt - 1), self.max_backoff)
+
+
+class DeadLetterQueue:
+    """Persisted record of inputs whose tasks failed for good.
+
+    Entries are appended to a JSON lines file as
+    ``{"inputs", "error", "attempts", "time"}``. Inputs are stored as JSON,
+    with non-JSON values such as ``UTCDateTime`` converted to strings.
+
+    Parameters
+    ----------
+    path : str
+        The JSON lines file, created if missing.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+    def add(self, inputs, error, attempts=1):
+        entry = {
+            "inputs": inputs,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": attempts,
+            "time": time.time(),
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def entries(self):
+        if not os.path.exists(self.path):
+            return []
+        with self._lock, open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def __len__(self):
+        return len(self.entries())
+
+    def _rewrite(self, entries):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + "\n")
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._rewrite([])
+
+    def replay(self, func, *args, **kwargs):
+        """
+        Run the task again for every entry, in this process.
+
+        Entries whose task succeeds are removed, the others are kept with
+        their attempt count and error updated.
+
+        Parameters
+        ----------
+        func : callable
+            The task function, called as ``func(inputs, *args, **kwargs)``.
+
+        Returns
+        -------
+        succeeded, failed : int
+            The number of entries replayed with and without success.
+        """
+        if not os.path.exists(self.path):
+            return 0, 0
+        kept, succeeded = [], 0
+        for entry in self.entries():
+            try:
+                func(entry["inputs"], *args, **kwargs)
+                succeeded += 1
+            except Exception as error:
+                entry["attempts"] += 1
+                entry["error"] = f"{type(error).__name__}: {error}"
+                entry["time"] = time.time()
+                kept.append(entry)
+        with self._lock:
+            # keep entries that were added while replaying
+            with open(self.path) as f:
+                lines = f.readlines()
+            added = [json.loads(line) for line in lines[succeeded + len(kept) :]]
+            self._rewrite(kept + added)
+        return succeeded, len(kept)
@@ -0,0 +1,4 @@
+from .base import Lease, WorkQueue, publish
+from .memory import MemoryWorkQueue
+from .sqlite import SQLiteWorkQueue
+from .broker import BrokerClient, BrokerServer
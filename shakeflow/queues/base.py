@@ -0,0 +1,125 @@
+import json
+import uuid
+import inspect
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+Lease = namedtuple("Lease", ["id", "items", "expires"])
+
+
+def _encode(item):
+    """The canonical JSON text of an item, which also identifies it."""
+    return json.dumps(item, default=str, sort_keys=True)
+
+
+def _new_lease_id():
+    return uuid.uuid4().hex
+
+
+class WorkQueue:
+    """Work queue shared by several workers, possibly on several hosts.
+
+    Items are JSON-serializable values, e.g. a file path, a list of files
+    forming one window, or a time string. Workers take items under a lease
+    that expires after ``ttl`` seconds unless it is renewed with
+    :meth:`heartbeat`, and finish it with :meth:`ack` or give the items back
+    with :meth:`nack`. Items of expired leases are handed out again, so a
+    crashed worker loses nothing. Items that are pending or leased are not
+    added twice.
+    """
+
+    def put(self, items):
+        """Add items, returning the number actually added."""
+        raise NotImplementedError
+
+    def lease(self, n=1, ttl=60):
+        """Lease up to ``n`` pending items, oldest first.
+
+        Returns
+        -------
+        lease : Lease
+            ``(id, items, expires)``, or None if nothing is pending.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, lease_id, ttl=60):
+        """Extend a lease, returning False if it has already expired."""
+        raise NotImplementedError
+
+    def ack(self, lease_id):
+        """Finish a lease and drop its items."""
+        raise NotImplementedError
+
+    def nack(self, lease_id):
+        """Give the items of a lease back to the queue."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return the numbers of pending and leased items as a dict."""
+        raise NotImplementedError
+
+    @contextmanager
+    def keep_alive(self, lease, ttl=60, interval=None):
+        """Heartbeat a lease from a background thread while in the block."""
+        stop = threading.Event()
+        interval = interval if interval is not None else ttl / 3
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(lease.id, ttl):
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            thread.join()
+
+
+def publish(source, queue, n=1, group=False, stop=None, timeout=1.0):
+    """
+    Move work from a local monitor to a shared work queue.
+
+    Each batch is acknowledged to the source as soon as :meth:`WorkQueue.put`
+    returns, which hands it off: the source, and the manifest of a
+    :func:`file_monitor` queue, records it as finished although the workers
+    of the shared queue have not processed it yet. The shared queue is then
+    the only record of the work, so use a durable one, a
+    :class:`SQLiteWorkQueue` or a broker serving one, to keep work across a
+    crash. A :class:`MemoryWorkQueue` loses the handed off items when its
+    process exits, and a resumed monitor does not add them again.
+
+    Parameters
+    ----------
+    source : FileQueue, FileHandler or EventHandler
+        Anything with ``get_batch(n, timeout)`` and ``ack(batch)``, such as
+        the queue of :func:`file_monitor` or the handler of
+        :func:`time_monitor`. Sources whose ``get_batch`` takes ``partial``
+        hand out fewer than ``n`` items once ``timeout`` expires, so that the
+        last files of a backfill are published too.
+    queue : WorkQueue
+        The shared queue.
+    n : int
+        The batch size taken from the source.
+    group : bool
+        If True, each batch becomes one item (e.g. the files of a window),
+        otherwise each element becomes an item.
+    stop : threading.Event
+        Stops the loop when set. None runs forever.
+    timeout : int or float
+        How often ``stop`` is checked, in seconds.
+    """
+    ack = getattr(source, "ack", None) or source.queue.ack
+    options = {}
+    if "partial" in inspect.signature(source.get_batch).parameters:
+        options["partial"] = True
+    while stop is None or not stop.is_set():
+        batch = source.get_batch(n, timeout=timeout, **options)
+        if not batch:
+            continue
+        items = [[str(x) for x in batch]] if group else [str(x) for x in batch]
+        queue.put(items)
+        ack(batch)
@@ -0,0 +1,135 @@
+import json
+import socket
+import threading
+import socketserver
+
+from .base import Lease, WorkQueue
+from .memory import MemoryWorkQueue
+
+_OPERATIONS = ("put", "lease", "heartbeat", "ack", "nack", "stats")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        queue = self.server.queue
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.pop("op")
+                if op not in _OPERATIONS:
+                    raise ValueError(f"unknown operation {op!r}")
+                reply = {"result": getattr(queue, op)(**request)}
+            except Exception as error:
+                reply = {"error": f"{type(error).__name__}: {error}"}
+            self.wfile.write((json.dumps(reply, default=str) + "\n").encode())
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    """Serve a :class:`WorkQueue` to workers on other hosts over TCP.
+
+    The protocol is one JSON object per line in each direction, a request
+    ``{"op": ..., **arguments}`` followed by a reply ``{"result": ...}`` or
+    ``{"error": ...}``. There is no authentication, so bind it to a trusted
+    network only.
+
+    Parameters
+    ----------
+    address : tuple
+        The ``(host, port)`` to listen on. Port 0 picks a free port, see
+        :attr:`address`.
+    queue : WorkQueue
+        The served queue. Defaults to a new :class:`MemoryWorkQueue`.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), queue=None):
+        super().__init__(address, _Handler)
+        self.queue = queue if queue is not None else MemoryWorkQueue()
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server_address[:2]
+
+    def start(self):
+        """Serve from a daemon thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class BrokerClient(WorkQueue):
+    """:class:`WorkQueue` served by a :class:`BrokerServer`.
+
+    The client keeps one connection, reconnecting once when it was lost.
+
+    Parameters
+    ----------
+    address : tuple
+        The ``(host, port)`` of the broker.
+    timeout : int or float
+        The socket timeout, in seconds.
+    """
+
+    def __init__(self, address, timeout=30):
+        self.address = tuple(address)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, self.timeout)
+        self._file = self._sock.makefile("rwb")
+
+    def _call(self, op, **kwargs):
+        request = (json.dumps({"op": op, **kwargs}) + "\n").encode()
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._file.write(request)
+                    self._file.flush()
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("broker closed the connection")
+                    break
+                except OSError:
+                    self.close()
+                    if attempt:
+                        raise
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def put(self, items):
+        return self._call("put", items=list(items))
+
+    def lease(self, n=1, ttl=60):
+        lease = self._call("lease", n=n, ttl=ttl)
+        return None if lease is None else Lease(*lease)
+
+    def heartbeat(self, lease_id, ttl=60):
+        return self._call("heartbeat", lease_id=lease_id, ttl=ttl)
+
+    def ack(self, lease_id):
+        return self._call("ack", lease_id=lease_id)
+
+    def nack(self, lease_id):
+        return self._call("nack", lease_id=lease_id)
+
+    def stats(self):
+        return self._call("stats")
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
@@ -0,0 +1,83 @@
+import json
+import time
+import heapq
+import itertools
+import threading
+
+from .base import Lease, WorkQueue, _encode, _new_lease_id
+
+
+class MemoryWorkQueue(WorkQueue):
+    """In-process :class:`WorkQueue`, e.g. the backend of a broker."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = {}
+        self._leases = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _requeue(self, lease_id):
+        keys, _ = self._leases.pop(lease_id)
+        for key in keys:
+            heapq.heappush(self._heap, (self._seq[key], key))
+
+    def _expire(self):
+        now = time.time()
+        for lease_id, (_, expires) in list(self._leases.items()):
+            if expires <= now:
+                self._requeue(lease_id)
+
+    def put(self, items):
+        added = 0
+        with self._lock:
+            for item in items:
+                key = _encode(item)
+                if key not in self._seq:
+                    self._seq[key] = next(self._counter)
+                    heapq.heappush(self._heap, (self._seq[key], key))
+                    added += 1
+        return added
+
+    def lease(self, n=1, ttl=60):
+        with self._lock:
+            self._expire()
+            keys = [
+                heapq.heappop(self._heap)[1] for _ in range(min(n, len(self._heap)))
+            ]
+            if not keys:
+                return None
+            lease = Lease(
+                _new_lease_id(), [json.loads(k) for k in keys], time.time() + ttl
+            )
+            self._leases[lease.id] = (keys, lease.expires)
+        return lease
+
+    def heartbeat(self, lease_id, ttl=60):
+        with self._lock:
+            if lease_id not in self._leases:
+                return False
+            keys, expires = self._leases[lease_id]
+            if expires <= time.time():
+                self._requeue(lease_id)
+                return False
+            self._leases[lease_id] = (keys, time.time() + ttl)
+            return True
+
+    def ack(self, lease_id):
+        with self._lock:
+            keys, _ = self._leases.pop(lease_id, ((), None))
+            for key in keys:
+                del self._seq[key]
+
+    def nack(self, lease_id):
+        with self._lock:
+            if lease_id in self._leases:
+                self._requeue(lease_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._heap),
+                "leased": len(self._seq) - len(self._heap),
+            }
@@ -0,0 +1,127 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .base import Lease, WorkQueue, _encode, _new_lease_id
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """:class:`WorkQueue` in a SQLite file on a filesystem shared by the hosts.
+
+    SQLite's own locking is unreliable on network filesystems, so every
+    operation also holds an exclusive ``flock`` on a lock file next to the
+    database, and the database uses a rollback journal rather than WAL, which
+    needs shared memory. Lease expiry compares wall clocks, so the hosts'
+    clocks should be synchronized to well below the lease ``ttl``.
+
+    Parameters
+    ----------
+    path : str
+        The database file, created if missing.
+    timeout : int or float
+        The longest wait for the database, in seconds.
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._locked() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS items "
+                "(key TEXT PRIMARY KEY, lease TEXT, expires REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS items_lease ON items (lease)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=DELETE")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _locked(self):
+        db = self._connection()
+        with self._lock, open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def put(self, items):
+        with self._locked() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO items (key) VALUES (?)",
+                [(_encode(item),) for item in items],
+            )
+            return db.total_changes - before
+
+    def lease(self, n=1, ttl=60):
+        now = time.time()
+        with self._locked() as db:
+            db.execute(
+                "UPDATE items SET lease = NULL, expires = NULL WHERE expires <= ?",
+                (now,),
+            )
+            rows = db.execute(
+                "SELECT rowid, key FROM items WHERE lease IS NULL "
+                "ORDER BY rowid LIMIT ?",
+                (n,),
+            ).fetchall()
+            if not rows:
+                return None
+            lease = Lease(_new_lease_id(), [json.loads(k) for _, k in rows], now + ttl)
+            db.executemany(
+                "UPDATE items SET lease = ?, expires = ? WHERE rowid = ?",
+                [(lease.id, lease.expires, rowid) for rowid, _ in rows],
+            )
+        return lease
+
+    def heartbeat(self, lease_id, ttl=60):
+        now = time.time()
+        with self._locked() as db:
+            cursor = db.execute(
+                "UPDATE items SET expires = ? WHERE lease = ? AND expires > ?",
+                (now + ttl, lease_id, now),
+            )
+            return cursor.rowcount > 0
+
+    def ack(self, lease_id):
+        with self._locked() as db:
+            db.execute("DELETE FROM items WHERE lease = ?", (lease_id,))
+
+    def nack(self, lease_id):
+        with self._locked() as db:
+            db.execute(
+                "UPDATE items SET lease = NULL, expires = NULL WHERE lease = ?",
+                (lease_id,),
+            )
+
+    def stats(self):
+        with self._locked() as db:
+            pending, leased = db.execute(
+                "SELECT COUNT(*) - COUNT(lease), COUNT(lease) FROM items"
+            ).fetchone()
+        return {"pending": pending, "leased": leased}
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
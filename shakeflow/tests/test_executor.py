@@ -0,0 +1,229 @@
+import os
+import time
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from shakeflow.pipeline import DeadLetterQueue, RetryPolicy, TaskExecutor
+
+
+def square(x, delay=0.0):
+    time.sleep(delay)
+    return x * x
+
+
+def count(files, delay=0.0):
+    time.sleep(delay)
+    return len(files)
+
+
+def fail(x):
+    raise ValueError(f"bad input {x}")
+
+
+def flaky(path, failures):
+    """Fail the first ``failures`` calls, counted in the file ``path``."""
+    with open(path, "a+") as f:
+        f.seek(0)
+        calls = len(f.read())
+        f.write("x")
+    if calls < failures:
+        raise OSError("transient")
+    return calls
+
+
+def crash(path):
+    """Kill the worker process on the first call, counted in ``path``."""
+    if not os.path.exists(path):
+        open(path, "w").close()
+        os._exit(1)
+    return "survived"
+
+
+class _Commits:
+    def __init__(self):
+        self.done = []
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def on_done(self, inputs, result):
+        with self.lock:
+            self.done.append((inputs, result))
+
+    def on_error(self, inputs, error):
+        with self.lock:
+            self.errors.append((inputs, error))
+
+
+@pytest.fixture
+def commits():
+    return _Commits()
+
+
+def _executor(func, commits, **kwargs):
+    kwargs.setdefault("workers", 2)
+    return TaskExecutor(
+        func, on_done=commits.on_done, on_error=commits.on_error, **kwargs
+    )
+
+
+def test_commits_in_submission_order(commits):
+    executor = _executor(square, commits, workers=4)
+    try:
+        # later tasks finish first
+        for x in range(4):
+            assert executor.submit(x, (3 - x) * 0.1)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert commits.done == [(0, 0), (1, 1), (2, 4), (3, 9)]
+    assert len(executor) == 0
+
+
+def test_inputs_in_flight_are_not_submitted_twice(commits):
+    executor = _executor(count, commits)
+    try:
+        assert executor.submit([1, 2], 0.2) is True
+        assert [1, 2] in executor
+        assert executor.submit([1, 2]) is False
+        assert executor.join(10)
+        assert executor.submit([1, 2]) is True
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert commits.done == [([1, 2], 2), ([1, 2], 2)]
+
+
+def test_max_pending(commits):
+    executor = _executor(square, commits, workers=1, max_pending=1)
+    try:
+        assert executor.submit(1, 0.3)
+        assert not executor.submit(2, timeout=0.05)
+        assert executor.submit(2, timeout=10)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert commits.done == [(1, 1), (2, 4)]
+
+
+def test_failures_go_to_on_error(commits):
+    executor = _executor(fail, commits)
+    try:
+        executor.submit(1)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert commits.done == []
+    [(inputs, error)] = commits.errors
+    assert inputs == 1 and isinstance(error, ValueError)
+
+
+def test_failures_go_to_on_done_without_on_error():
+    done = []
+    executor = TaskExecutor(fail, workers=1, on_done=lambda i, r: done.append((i, r)))
+    try:
+        executor.submit(1)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert done == [(1, None)]
+
+
+def test_failing_commit_does_not_block_later_ones():
+    done = []
+
+    def on_done(inputs, result):
+        if inputs == 0:
+            raise RuntimeError("commit failed")
+        done.append(inputs)
+
+    executor = TaskExecutor(square, workers=3, on_done=on_done)
+    try:
+        executor.submit(0, 0.3)
+        executor.submit(1)
+        executor.submit(2)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert done == [1, 2]
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, backoff=1, factor=2, max_backoff=3)
+    assert [policy.delay(a) for a in (1, 2, 3)] == [1, 2, 3]
+    assert policy.should_retry(2, OSError())
+    assert not policy.should_retry(3, OSError())
+    policy = RetryPolicy(retry_on=(OSError,))
+    assert not policy.should_retry(1, ValueError())
+
+
+def test_retry(commits, tmp_path):
+    retry = RetryPolicy(max_attempts=3, backoff=0.01)
+    executor = _executor(flaky, commits, retry=retry)
+    try:
+        executor.submit(str(tmp_path / "calls"), 2)
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert commits.done == [(str(tmp_path / "calls"), 2)]
+    assert commits.errors == []
+
+
+def test_dead_letter(commits, tmp_path):
+    dead_letter = DeadLetterQueue(tmp_path / "dead.jsonl")
+    retry = RetryPolicy(max_attempts=2, backoff=0.01)
+    executor = _executor(fail, commits, retry=retry, dead_letter=dead_letter)
+    try:
+        executor.submit([1, 2])
+        executor.submit([3])
+        assert executor.join(10)
+    finally:
+        executor.shutdown()
+    assert [inputs for inputs, _ in commits.errors] == [[1, 2], [3]]
+    entries = dead_letter.entries()
+    assert sorted(entry["inputs"] for entry in entries) == [[1, 2], [3]]
+    assert all(entry["attempts"] == 2 for entry in entries)
+    assert "ValueError: bad input" in entries[0]["error"]
+
+
+def test_replay(tmp_path):
+    dead_letter = DeadLetterQueue(tmp_path / "dead.jsonl")
+    assert dead_letter.replay(square) == (0, 0)
+    dead_letter.add(2, ValueError("x"))
+    dead_letter.add("three", ValueError("x"))
+    # the string input fails again and is kept
+    assert dead_letter.replay(square) == (1, 1)
+    [entry] = dead_letter.entries()
+    assert entry["inputs"] == "three"
+    assert entry["attempts"] == 2
+    assert entry["error"].startswith("TypeError")
+    dead_letter.clear()
+    assert len(dead_letter) == 0
+
+
+def test_recovers_from_a_broken_pool(commits, tmp_path):
+    executor = _executor(crash, commits, workers=1)
+    try:
+        executor.submit(str(tmp_path / "crashed"))
+        assert executor.join(30)
+        [(_, error)] = commits.errors
+        assert isinstance(error, BrokenProcessPool)
+        # the next tasks run in a new pool
+        executor.submit(str(tmp_path / "crashed"))
+        assert executor.join(30)
+    finally:
+        executor.shutdown()
+    assert commits.done == [(str(tmp_path / "crashed"), "survived")]
+
+
+def test_retries_tasks_of_a_broken_pool(commits, tmp_path):
+    retry = RetryPolicy(max_attempts=2, backoff=0.01)
+    executor = _executor(crash, commits, workers=1, retry=retry)
+    try:
+        executor.submit(str(tmp_path / "crashed"))
+        assert executor.join(30)
+    finally:
+        executor.shutdown()
+    assert commits.done == [(str(tmp_path / "crashed"), "survived")]
+    assert commits.errors == []
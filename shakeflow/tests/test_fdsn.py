@@ -0,0 +1,134 @@
+import io
+import time
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pytest
+import requests
+from obspy import Trace, UTCDateTime
+
+from shakeflow.clients import FDSNDownloader
+
+T0 = UTCDateTime("2024-01-01T00:00:00")
+
+
+def _mseed(station):
+    header = {
+        "network": "AM",
+        "station": station,
+        "location": "00",
+        "channel": "EHZ",
+        "starttime": T0,
+    }
+    trace = Trace(np.arange(100, dtype=np.int32), header=header)
+    buffer = io.BytesIO()
+    trace.write(buffer, format="MSEED")
+    return buffer.getvalue()
+
+
+class _Service(BaseHTTPRequestHandler):
+    """A dataselect stand-in answering by station code.
+
+    OK sends data, NODATA nothing, FLAKY fails once, BAD always fails and
+    SLOW takes a while, recording the number of concurrent requests.
+    """
+
+    def do_GET(self):
+        server = self.server
+        station = parse_qs(urlsplit(self.path).query)["sta"][0]
+        with server.lock:
+            server.requests[station] += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            attempt = server.requests[station]
+        try:
+            if station == "SLOW":
+                time.sleep(0.1)
+            if station == "NODATA":
+                self.send_response(204)
+                self.end_headers()
+            elif station == "BAD" or (station == "FLAKY" and attempt == 1):
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                body = _mseed(station)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/vnd.fdsn.mseed")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def service():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Service)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = Counter()
+    server.active = server.max_active = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader(service):
+    host, port = service.server_address[:2]
+    downloader = FDSNDownloader(
+        f"http://{host}:{port}", workers=8, per_host=2, timeout=5, retries=1
+    )
+    yield downloader
+    downloader.close()
+
+
+def test_get_waveforms(downloader):
+    stream = downloader.get_waveforms("AM", "OK", "00", "EHZ", T0, T0 + 1)
+    assert len(stream) == 1
+    assert stream[0].stats.station == "OK"
+    assert stream[0].stats.starttime == T0
+    np.testing.assert_array_equal(stream[0].data, np.arange(100))
+
+
+def test_no_data(downloader):
+    assert len(downloader.get_waveforms("AM", "NODATA", "00", "EHZ", T0, T0 + 1)) == 0
+
+
+def test_retry(downloader, service):
+    stream = downloader.get_waveforms("AM", "FLAKY", "00", "EHZ", T0, T0 + 1)
+    assert stream[0].stats.station == "FLAKY"
+    assert service.requests["FLAKY"] == 2
+
+
+def test_retries_exhausted(downloader, service):
+    with pytest.raises(requests.HTTPError):
+        downloader.get_waveforms("AM", "BAD", "00", "EHZ", T0, T0 + 1)
+    assert service.requests["BAD"] == 2
+
+
+def test_per_host_cap(downloader, service):
+    bulk = [("AM", "SLOW", "00", "EHZ", T0, T0 + 1)] * 8
+    streams = downloader.get_waveforms_bulk(bulk)
+    assert all(len(stream) == 1 for stream in streams)
+    assert service.max_active == 2
+
+
+def test_bulk_isolates_failures(downloader):
+    stations = ["OK", "BAD", "NODATA", "FLAKY"]
+    bulk = [("AM", station, "00", "EHZ", T0, T0 + 1) for station in stations]
+    ok, bad, nodata, flaky = downloader.get_waveforms_bulk(bulk)
+    assert ok[0].stats.station == "OK"
+    assert isinstance(bad, requests.HTTPError)
+    assert len(nodata) == 0
+    assert flaky[0].stats.station == "FLAKY"
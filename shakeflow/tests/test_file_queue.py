@@ -0,0 +1,208 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from shakeflow.watchdog.file_queue import FileQueue
+from shakeflow.watchdog.manifest import Manifest
+
+
+def _put_in_thread(queue, files):
+    thread = threading.Thread(target=queue.put_many, args=(files,), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_claim_in_sorted_order():
+    queue = FileQueue(["c", "a", "b"])
+    assert queue.claim(2) == ["a", "b"]
+    assert queue.in_flight == 2
+    assert len(queue) == 1
+    # not enough files pending
+    assert queue.claim(2) == []
+    assert queue.claim(2, partial=True) == ["c"]
+
+
+def test_deduplication():
+    queue = FileQueue(history=2)
+    assert queue.put("a")
+    assert not queue.put("a")
+    files = queue.claim(1)
+    # in flight and finished files are ignored too
+    assert not queue.put("a")
+    queue.ack(files)
+    assert not queue.put("a")
+    assert "a" not in queue
+
+
+def test_history_is_bounded():
+    queue = FileQueue(["a", "b", "c"], history=2)
+    queue.ack(queue.claim(3))
+    # only the last two finished files are remembered
+    assert queue.put_many(["a", "b", "c"]) == 1
+    assert queue.claim(1) == ["a"]
+
+
+def test_release():
+    queue = FileQueue(["a", "b"])
+    files = queue.claim(2)
+    queue.release(files[:1])
+    assert queue.in_flight == 1
+    assert queue.claim(1) == ["a"]
+    # files that are not in flight are ignored
+    queue.release(["x"])
+    assert len(queue) == 0
+
+
+def test_get_batch_waits():
+    queue = FileQueue(["a"])
+    threading.Timer(0.1, queue.put, ("b",)).start()
+    assert queue.get_batch(2, timeout=5) == ["a", "b"]
+
+
+def test_get_batch_timeout():
+    queue = FileQueue(["a"])
+    assert queue.get_batch(2, timeout=0.05) == []
+    assert queue.get_batch(2, timeout=0.05, partial=True) == ["a"]
+
+
+def test_block_policy():
+    queue = FileQueue(maxsize=2)
+    thread = _put_in_thread(queue, ["a", "b", "c"])
+    time.sleep(0.1)
+    assert thread.is_alive()
+    assert len(queue) == 2
+    assert queue.claim(1) == ["a"]
+    thread.join(5)
+    assert not thread.is_alive()
+    assert queue.claim(2) == ["b", "c"]
+
+
+def test_block_policy_batch_above_maxsize():
+    queue = FileQueue(maxsize=2)
+    thread = _put_in_thread(queue, ["a", "b", "c"])
+    # a full queue hands out what it holds instead of deadlocking
+    assert queue.get_batch(3, timeout=5) == ["a", "b"]
+    thread.join(5)
+    assert queue.claim(3, partial=True) == ["c"]
+
+
+def test_drop_oldest_policy():
+    queue = FileQueue(["a", "b", "c", "d"], maxsize=2, policy="drop_oldest")
+    assert queue.dropped == 2
+    assert queue.stats()["dropped"] == 2
+    assert queue.claim(2) == ["c", "d"]
+
+
+def test_spill_policy(tmp_path):
+    queue = FileQueue(
+        ["d", "a", "c", "b"],
+        maxsize=2,
+        policy="spill",
+        spill_path=str(tmp_path / "spill.db"),
+    )
+    assert len(queue) == 2
+    assert queue.spilled == 2
+    assert queue.depth == 4
+    # spilled files are deduplicated as well
+    assert not queue.put("c")
+    assert queue.claim(4) == ["a", "b", "c", "d"]
+    assert queue.spilled == 0
+
+
+def test_live_lane_first():
+    queue = FileQueue(["a", "b", "live_x"], live=lambda f: f.startswith("live"))
+    assert queue.stats()["live"] == 1
+    assert queue.claim(2) == ["live_x", "a"]
+
+
+def test_lanes():
+    queue = FileQueue(["a", "live_x", "live_y"], live=lambda f: f.startswith("live"))
+    assert queue.claim(3, lane="backfill", partial=True) == ["a"]
+    assert queue.claim(1, lane="live") == ["live_x"]
+    assert queue.get_batch(1, timeout=0.05, lane="backfill") == []
+    assert queue.get_batch(1, timeout=0.05, lane="live") == ["live_y"]
+    with pytest.raises(ValueError):
+        queue.claim(1, lane="other")
+
+
+def test_live_files_bypass_maxsize():
+    queue = FileQueue(
+        ["a", "b"], maxsize=2, policy="drop_oldest", live=lambda f: f == "live"
+    )
+    queue.put_many(["live", "c"])
+    # the live file is kept, and only backfill files are dropped
+    assert queue.dropped == 1
+    assert queue.claim(3) == ["live", "b", "c"]
+
+
+def test_released_files_keep_their_lane():
+    queue = FileQueue(["a", "live"], live=lambda f: f == "live")
+    files = queue.claim(2)
+    queue.release(files)
+    assert queue.claim(1, lane="live") == ["live"]
+
+
+def test_age():
+    queue = FileQueue()
+    assert queue.age == 0.0
+    queue.put("a")
+    time.sleep(0.05)
+    assert queue.age >= 0.05
+    queue.claim(1)
+    assert queue.age == 0.0
+
+
+def test_arrivals_stay_bounded():
+    queue = FileQueue(history=10)
+    for i in range(2000):
+        queue.put(f"{i:05d}")
+        queue.ack(queue.claim(1))
+    assert len(queue._arrivals) <= 64
+
+
+def test_ack_records_in_manifest(tmp_path):
+    path = tmp_path / "a.h5"
+    path.write_text("data")
+    manifest = Manifest(str(tmp_path / "manifest.db"))
+    queue = FileQueue([str(path)], manifest=manifest, stage="s1")
+    queue.ack(queue.claim(1))
+    assert list(manifest.unprocessed("s1", [str(path)])) == []
+    assert list(manifest.unprocessed("s2", [str(path)])) == [str(path)]
+
+
+def test_batches():
+    queue = FileQueue(["a", "b", "c", "d"])
+
+    async def consume():
+        batches = []
+        async for files in queue.batches(2, poll=0.05):
+            batches.append(files)
+            if len(batches) == 2:
+                break
+        return batches
+
+    assert asyncio.run(consume()) == [["a", "b"], ["c", "d"]]
+
+
+def test_batches_cancellation_releases_files():
+    queue = FileQueue()
+
+    async def consume():
+        async for _ in queue.batches(2, poll=0.2):
+            pass
+
+    async def main():
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        # the wait in the executor claims these after the task is cancelled
+        queue.put_many(["a", "b"])
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.3)
+
+    asyncio.run(main())
+    assert queue.in_flight == 0
+    assert queue.claim(2) == ["a", "b"]
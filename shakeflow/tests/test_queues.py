@@ -0,0 +1,188 @@
+import time
+import threading
+
+import pytest
+
+from shakeflow.queues import (
+    BrokerClient,
+    BrokerServer,
+    MemoryWorkQueue,
+    SQLiteWorkQueue,
+    publish,
+)
+from shakeflow.watchdog.file_queue import FileQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryWorkQueue()
+    else:
+        queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+        yield queue
+        queue.close()
+
+
+@pytest.fixture
+def broker():
+    server = BrokerServer()
+    server.start()
+    client = BrokerClient(server.address, timeout=5)
+    yield server, client
+    client.close()
+    server.stop()
+
+
+def test_lease_ack(queue):
+    assert queue.put(["a", "b", "c"]) == 3
+    lease = queue.lease(2)
+    assert lease.items == ["a", "b"]
+    assert queue.stats() == {"pending": 1, "leased": 2}
+    queue.ack(lease.id)
+    assert queue.stats() == {"pending": 1, "leased": 0}
+    assert queue.lease(5).items == ["c"]
+    assert queue.lease() is None
+
+
+def test_put_deduplicates(queue):
+    assert queue.put(["a", ["b", "c"]]) == 2
+    assert queue.put(["a", ["b", "c"], "d"]) == 1
+    lease = queue.lease(3)
+    assert lease.items == ["a", ["b", "c"], "d"]
+    # leased items are not added twice either
+    assert queue.put(["a"]) == 0
+    queue.ack(lease.id)
+    assert queue.put(["a"]) == 1
+
+
+def test_nack(queue):
+    queue.put(["a", "b"])
+    lease = queue.lease(1)
+    queue.nack(lease.id)
+    assert queue.stats() == {"pending": 2, "leased": 0}
+    # items given back keep their place
+    assert queue.lease(2).items == ["a", "b"]
+
+
+def test_lease_expiry(queue):
+    queue.put(["a"])
+    lease = queue.lease(ttl=0.1)
+    assert queue.lease() is None
+    time.sleep(0.2)
+    again = queue.lease()
+    assert again.items == ["a"]
+    assert again.id != lease.id
+    assert not queue.heartbeat(lease.id)
+
+
+def test_heartbeat(queue):
+    queue.put(["a"])
+    lease = queue.lease(ttl=0.3)
+    for _ in range(3):
+        time.sleep(0.15)
+        assert queue.heartbeat(lease.id, ttl=0.3)
+    assert queue.lease() is None
+    queue.ack(lease.id)
+    assert queue.stats() == {"pending": 0, "leased": 0}
+
+
+def test_keep_alive(queue):
+    queue.put(["a"])
+    lease = queue.lease(ttl=0.2)
+    with queue.keep_alive(lease, ttl=0.2, interval=0.05):
+        time.sleep(0.5)
+        assert queue.lease() is None
+    queue.ack(lease.id)
+
+
+def test_sqlite_shared_between_connections(tmp_path):
+    path = str(tmp_path / "queue.db")
+    producer, consumer = SQLiteWorkQueue(path), SQLiteWorkQueue(path)
+    producer.put(["a"])
+    lease = consumer.lease()
+    assert lease.items == ["a"]
+    assert producer.lease() is None
+    consumer.ack(lease.id)
+    assert producer.stats() == {"pending": 0, "leased": 0}
+    producer.close()
+    consumer.close()
+
+
+def test_broker_round_trip(broker):
+    server, client = broker
+    assert client.put(["a", ["b", "c"]]) == 2
+    lease = client.lease(2, ttl=10)
+    assert lease.items == ["a", ["b", "c"]]
+    assert client.heartbeat(lease.id, ttl=10)
+    client.nack(lease.id)
+    lease = client.lease(1)
+    client.ack(lease.id)
+    assert client.stats() == {"pending": 1, "leased": 0}
+    assert server.queue.stats() == {"pending": 1, "leased": 0}
+
+
+def test_broker_errors(broker):
+    _, client = broker
+    with pytest.raises(RuntimeError):
+        client._call("close")
+    # the connection is still usable
+    assert client.stats() == {"pending": 0, "leased": 0}
+
+
+def test_broker_reconnects(broker):
+    _, client = broker
+    client.put(["a"])
+    client._sock.close()
+    assert client.stats() == {"pending": 1, "leased": 0}
+
+
+class _Source:
+    def __init__(self, items):
+        self.items = list(items)
+        self.acked = []
+
+    def get_batch(self, n=1, timeout=None):
+        batch, self.items = self.items[:n], self.items[n:]
+        if not batch:
+            time.sleep(timeout)
+        return batch
+
+    def ack(self, batch):
+        self.acked.extend(batch)
+
+
+@pytest.mark.parametrize("group", [False, True])
+def test_publish(group):
+    source, queue, stop = _Source(["a", "b", "c"]), MemoryWorkQueue(), threading.Event()
+    thread = threading.Thread(
+        target=publish, args=(source, queue, 2, group, stop, 0.05)
+    )
+    thread.start()
+    deadline = time.time() + 5
+    while len(source.acked) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+    assert source.acked == ["a", "b", "c"]
+    expected = [["a", "b"], ["c"]] if group else ["a", "b", "c"]
+    assert queue.lease(3).items == expected
+
+
+def test_publish_partial_batch():
+    source, queue, stop = (
+        FileQueue(["a", "b", "c"]),
+        MemoryWorkQueue(),
+        threading.Event(),
+    )
+    thread = threading.Thread(
+        target=publish, args=(source, queue, 2, False, stop, 0.05)
+    )
+    thread.start()
+    deadline = time.time() + 5
+    while queue.stats()["pending"] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+    # the last file is published on its own once the timeout expires
+    assert queue.lease(3).items == ["a", "b", "c"]
+    assert source.in_flight == 0
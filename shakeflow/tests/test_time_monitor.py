@@ -0,0 +1,212 @@
+import logging
+import threading
+
+import pytest
+from obspy import UTCDateTime
+
+from shakeflow.watchdog.time_monitor import EventHandler, time_monitor
+from shakeflow.watchdog.window_store import WindowStore
+
+T0 = UTCDateTime("2024-01-01T00:00:00")
+
+
+def _handler(windows=10, **kwargs):
+    """A handler with 60 s windows of which ``windows`` are due."""
+    handler = EventHandler(T0, 60, 0, **kwargs)
+    handler.fire(T0 + 60 * (windows - 1))
+    return handler
+
+
+def test_store_claim_ack_release():
+    store = WindowStore(0, 10)
+    store.extend(3)
+    assert store.start_ns(2) == 20
+    assert store.index(20) == 2
+    assert store.claim() == 0
+    assert store.claim_index(2)
+    assert not store.claim_index(2)
+    assert store.next_pending() == 1
+    assert (store.pending, store.in_flight) == (1, 2)
+    store.release(0)
+    assert store.next_pending() == 0
+    store.ack(2)
+    assert store.is_done(2)
+    assert store.done_prefix == 0
+    # done windows cannot be released
+    store.release(2)
+    assert store.is_claimed(2)
+
+
+def test_store_trims_done_prefix():
+    store = WindowStore(0, 10)
+    store.trim_bytes = 2
+    store.extend(100)
+    for _ in range(40):
+        store.ack(store.claim())
+    assert store.done_prefix == 40
+    # whole bytes of done windows are dropped
+    assert store._base == 32
+    assert len(store._claimed) == len(store._done) == (100 - 32 + 7) // 8
+    # trimmed windows still read as claimed and done
+    assert store.is_claimed(0) and store.is_done(39)
+    assert store.claim() == 40
+    store.extend(200)
+    assert store.claim_index(199)
+    store.ack(199)
+    assert store.is_done(199)
+    assert (store.count, store.claimed_count, store.done_count) == (200, 42, 41)
+
+
+def test_fire_marks_due_windows():
+    handler = EventHandler(T0, 60, 30)
+    assert handler.store.count == 1
+    handler.fire(T0 + 60 + 29)
+    assert handler.store.count == 1
+    handler.fire(T0 + 60 + 30)
+    assert handler.store.count == 2
+    assert list(handler.times) == [T0, T0 + 60]
+    assert handler.starttime == T0 + 60
+    assert handler.next_deadline() == (T0 + 150).timestamp
+    # time never moves the schedule back
+    handler.fire(T0)
+    assert handler.store.count == 2
+
+
+def test_claim_ack_release():
+    handler = _handler(3)
+    assert handler.claim(2) == [T0, T0 + 60]
+    assert (handler.pending, handler.in_flight) == (1, 2)
+    handler.release([T0])
+    assert handler.next_pending() == T0
+    handler.ack([T0 + 60])
+    assert handler.claim(5) == [T0, T0 + 120]
+    assert handler.claim() == []
+
+
+def test_max_in_flight():
+    handler = _handler(5, max_in_flight=2)
+    assert handler.claim(5) == [T0, T0 + 60]
+    assert handler.get_batch(1, timeout=0.01) == []
+    handler.ack([T0])
+    assert handler.claim(5) == [T0 + 120]
+
+
+def test_get_batch_wakes_on_fire():
+    handler = _handler(1)
+    handler.claim()
+    threading.Timer(0.1, handler.fire, (T0 + 60,)).start()
+    assert handler.get_batch(1, timeout=5) == [T0 + 60]
+
+
+def test_live_windows_first():
+    handler = _handler(6, live_windows=2)
+    assert handler.live_start == 4
+    assert handler.claim(3) == [T0 + 300, T0 + 240, T0]
+    assert handler.claim(1, lane="live") == []
+    handler.fire(T0 + 360)
+    # the window that stopped being live keeps its place in the backlog
+    assert handler.claim(1, lane="live") == [T0 + 360]
+    assert handler.claim(5, lane="backfill") == [T0 + 60, T0 + 120, T0 + 180]
+    with pytest.raises(ValueError):
+        handler.claim(1, lane="other")
+
+
+def test_live_share():
+    handler = _handler(10, max_in_flight=4, live_windows=1, live_share=0.5)
+    assert handler.reserved == 2
+    # the backlog leaves two slots for live windows
+    assert handler.claim(4, lane="backfill") == [T0, T0 + 60]
+    assert handler.claim(4, lane="live") == [T0 + 540]
+    handler.fire(T0 + 600)
+    assert handler.claim(4) == [T0 + 600]
+    assert handler.claim(4) == []
+    handler.ack([T0 + 540, T0 + 600])
+    assert handler.claim(4, lane="backfill") == []
+    handler.ack([T0])
+    assert handler.claim(4, lane="backfill") == [T0 + 120]
+
+
+def test_cascade_release_order():
+    child = _handler(9)
+    parent = child.cascade(180)
+    assert list(parent.dependencies(T0 + 180)) == [T0 + 180, T0 + 240, T0 + 300]
+    for t in child.claim(9):
+        assert parent.store.count == 0
+        if t >= T0 + 180:
+            child.ack([t])
+    # later coarse windows wait for the earlier ones
+    assert parent.store.count == 0
+    child.ack([T0, T0 + 60])
+    assert parent.store.count == 0
+    child.ack([T0 + 120])
+    assert parent.store.count == 3
+    assert parent.claim(5) == [T0, T0 + 180, T0 + 360]
+
+
+def test_chained_cascades():
+    child = _handler(6)
+    hourly = child.cascade(120)
+    daily = hourly.cascade(360)
+    child.ack(child.claim(6))
+    assert hourly.store.count == 3
+    assert daily.store.count == 0
+    hourly.ack(hourly.claim(3))
+    assert daily.claim() == [T0]
+
+
+def test_cascade_interval_must_be_a_multiple():
+    with pytest.raises(ValueError):
+        _handler(1).cascade(90)
+
+
+def test_probe_releases_windows_early():
+    available = T0 + 300
+    handler = EventHandler(T0, 60, 3600, probe=lambda start, end: end <= available)
+    handler.fire(T0 + 600)
+    assert list(handler.times) == [T0 + 60 * i for i in range(5)]
+    # the window after is probed again later, and due after time_lagging
+    assert handler.next_deadline() == (T0 + 300 + 3600).timestamp
+
+
+def test_probe_errors_are_logged(caplog):
+    def probe(start, end):
+        raise RuntimeError("service down")
+
+    handler = EventHandler(T0, 60, 3600, probe=probe)
+    with caplog.at_level(logging.ERROR):
+        handler.fire(T0 + 600)
+    assert handler.store.count == 1
+    assert "service down" in caplog.text
+
+
+def test_probe_timeout(caplog):
+    hung = threading.Event()
+    calls = []
+
+    def probe(start, end):
+        calls.append(start)
+        hung.wait(5)
+        return True
+
+    handler = EventHandler(T0, 60, 3600, probe=probe, probe_timeout=0.05)
+    try:
+        with caplog.at_level(logging.WARNING):
+            handler.fire(T0 + 600)
+        assert handler.store.count == 1
+        assert "timed out" in caplog.text
+        # a hung probe is not started again
+        handler.fire(T0 + 600)
+        assert len(calls) == 1
+    finally:
+        hung.set()
+
+
+def test_time_monitor_thread():
+    starttime = UTCDateTime() - 3
+    observer, handler = time_monitor(starttime, time_interval=1, time_lagging=0)
+    observer.start()
+    try:
+        assert len(handler.get_batch(3, timeout=5)) >= 3
+    finally:
+        observer.stop()
+        observer.join()
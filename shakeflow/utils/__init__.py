@@ -1,2 +1,3 @@
 from .logger import get_logger
 from .simulator import simulator
+from .shared import SharedArray, SharedArrays
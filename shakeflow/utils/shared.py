@@ -0,0 +1,134 @@
+import os
+import uuid
+import shutil
+import tempfile
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+
+class SharedArray(namedtuple("SharedArray", ["path", "shape", "dtype"])):
+    """Picklable handle of an array held by :class:`SharedArrays`.
+
+    Only the handle travels to a worker process, which maps the same memory
+    with :meth:`open` instead of receiving a pickled copy.
+    """
+
+    __slots__ = ()
+
+    def open(self, mode="r+"):
+        """
+        Map the array into this process.
+
+        Parameters
+        ----------
+        mode : str
+            "r+" to read and write, "r" to read only.
+
+        Returns
+        -------
+        array : numpy.ndarray
+            A view of the shared memory, valid until it is garbage collected,
+            even after the segment was freed by its owner.
+        """
+        if int(np.prod(self.shape)) == 0:
+            return np.empty(self.shape, self.dtype)
+        return np.memmap(self.path, self.dtype, mode, shape=tuple(self.shape))
+
+
+def _scratch():
+    # tmpfs keeps the segments in memory, other filesystems in the page cache
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedArrays:
+    """Owner of arrays shared with worker processes without copying.
+
+    Each array is a memory-mapped file in a private directory on tmpfs
+    (``/dev/shm``), or in the temporary directory where there is none. Files
+    are used rather than ``multiprocessing.shared_memory``, whose resource
+    tracker unlinks segments when the first worker that attached them exits.
+    Segments are freed with :meth:`free`, and all remaining ones when the
+    owner is closed, leaves its ``with`` block or is garbage collected.
+    Workers that still map a freed segment keep a valid view.
+
+    Parameters
+    ----------
+    dir : str
+        The parent of the private directory. Defaults to ``/dev/shm``.
+
+    Examples
+    --------
+    >>> with SharedArrays() as arena:
+    ...     data = arena.share(stream.data)
+    ...     out = arena.empty((len(pairs), nlags))
+    ...     pool.submit(correlate, data, out, pairs).result()
+    ...     result = arena.open(out).copy()
+
+    where ``correlate`` calls ``data.open("r")`` and ``out.open()``.
+    """
+
+    def __init__(self, dir=None):
+        self.dir = tempfile.mkdtemp(prefix="shakeflow_shared_", dir=dir or _scratch())
+        self.arrays = {}
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.dir, True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.arrays)
+
+    @property
+    def nbytes(self):
+        """The total size of the live segments, in bytes."""
+        return sum(
+            int(np.prod(a.shape)) * np.dtype(a.dtype).itemsize
+            for a in self.arrays.values()
+        )
+
+    def empty(self, shape, dtype=np.float64):
+        """Allocate a zero-filled shared array, e.g. for workers to fill."""
+        shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            # the file would hold pointers, invalid in any other process
+            raise TypeError(f"cannot share arrays of Python objects ({dtype})")
+        path = os.path.join(self.dir, uuid.uuid4().hex)
+        with open(path, "wb") as f:
+            f.truncate(int(np.prod(shape)) * dtype.itemsize)
+        array = SharedArray(path, shape, dtype.str)
+        self.arrays[path] = array
+        return array
+
+    def share(self, array):
+        """Copy an array into shared memory, once, and return its handle."""
+        array = np.asarray(array)
+        shared = self.empty(array.shape, array.dtype)
+        if array.size:
+            view = shared.open()
+            view[...] = array
+            view.flush()
+        return shared
+
+    def open(self, array, mode="r+"):
+        """Map a shared array into this process, see :meth:`SharedArray.open`."""
+        return array.open(mode)
+
+    def free(self, *arrays):
+        """Release segments whose tasks have finished."""
+        for array in arrays:
+            self.arrays.pop(array.path, None)
+            try:
+                os.remove(array.path)
+            except OSError:
+                pass
+
+    def close(self):
+        """Release every segment."""
+        self.arrays.clear()
+        self._finalizer()
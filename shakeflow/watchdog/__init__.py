@@ -1,2 +1,10 @@
 from .file_monitor import file_monitor
-from .time_monitor import time_monitor
+from .hub import MonitorHub
+from .coalescer import Coalescer
+from .file_queue import FileQueue
+from .manifest import Manifest
+from .poller import AdaptivePollingObserver
+from .scanner import ScanCache, scan
+from .time_monitor import CascadeHandler, TimeMonitor, WindowRange, time_monitor
+from .window_store import WindowStore
+from .windows import TimeWindows, Window, recent
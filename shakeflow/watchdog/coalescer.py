@@ -0,0 +1,61 @@
+import time
+import threading
+from collections import deque
+
+
+class Coalescer:
+    """Collect items and deliver them in batches.
+
+    Items are buffered without locking and handed to ``callback`` as one list
+    once no new item has arrived for ``quiet`` seconds, once ``max_batch``
+    items are buffered, or at the latest ``max_delay`` seconds after the first
+    buffered item. The delivery runs on a daemon thread.
+
+    Parameters
+    ----------
+    callback : callable
+        Called with each list of items.
+    quiet : int or float
+        The quiet period that ends a burst, in seconds.
+    max_batch : int
+        The largest batch delivered at once.
+    max_delay : int or float
+        The longest time an item is held back, in seconds.
+    """
+
+    def __init__(self, callback, quiet=0.5, max_batch=1000, max_delay=5.0):
+        self.callback = callback
+        self.quiet = quiet
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._items = deque()
+        self._arrived = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        self._items.append(item)
+        self._arrived.set()
+
+    def flush(self):
+        """Deliver everything buffered so far."""
+        while self._items:
+            batch = []
+            while self._items and len(batch) < self.max_batch:
+                batch.append(self._items.popleft())
+            self.callback(batch)
+
+    def _run(self):
+        while True:
+            self._arrived.wait()
+            deadline = time.monotonic() + self.max_delay
+            self._arrived.clear()
+            while len(self._items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._arrived.wait(min(self.quiet, remaining)):
+                    break
+                self._arrived.clear()
+            self.flush()
@@ -1,24 +1,133 @@
 import os
-import glob
+import fnmatch
+import threading
+from itertools import islice
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from .coalescer import Coalescer
+from .file_queue import FileQueue
+from .manifest import Manifest
+from .poller import AdaptivePollingObserver
+from .readiness import StabilityTracker
+from .scanner import scan
+
+
+def _has_close_events():
+    try:
+        from watchdog.observers.inotify import InotifyObserver
+    except Exception:
+        return False
+    return Observer is InotifyObserver
+
 
 class FileHandler(FileSystemEventHandler):
-    def __init__(self, files, suffix):
+    def __init__(
+        self,
+        queue,
+        suffix,
+        ready="created",
+        settle=2.0,
+        pattern=None,
+        coalesce=0.0,
+        max_batch=1000,
+    ):
         self.suffix = suffix
-        self.files = files
+        self.pattern = pattern
+        self.queue = queue
+        self.ready = ready
+        if coalesce > 0:
+            self.coalescer = Coalescer(queue.put_many, coalesce, max_batch)
+            self._put = self.coalescer.add
+        else:
+            self.coalescer = None
+            self._put = queue.put
+        if ready == "created":
+            self.tracker = None
+        else:
+            self.tracker = StabilityTracker(self._put, settle=settle)
+        self.scanned = threading.Event()
+
+    def get_batch(self, n=1, timeout=None, partial=False, lane=None):
+        """Wait for and claim ``n`` files, see :meth:`FileQueue.get_batch`."""
+        return self.queue.get_batch(n, timeout, partial, lane)
+
+    def batches(self, n=1, poll=1.0, lane=None):
+        """Async iterator over claimed batches, see :meth:`FileQueue.batches`."""
+        return self.queue.batches(n, poll, lane)
+
+    def matches(self, path):
+        if not path.endswith(self.suffix):
+            return False
+        return self.pattern is None or fnmatch.fnmatch(
+            os.path.basename(path), self.pattern
+        )
+
+    def _match(self, event, path):
+        return not event.is_directory and self.matches(path)
 
     def on_created(self, event):
-        if event.is_directory:
-            pass
-        elif event.src_path.endswith(self.suffix):
-            self.files.append(event.src_path)
-        else:
+        if not self._match(event, event.src_path):
             pass
+        elif self.ready == "created":
+            self._put(event.src_path)
+        elif self.ready == "stable" or event.is_synthetic:
+            # files found in a new directory only get a synthetic created
+            # event, and may have been closed before its watch existed
+            self.tracker.add(event.src_path)
+
+    def on_closed(self, event):
+        if self.ready == "closed" and self._match(event, event.src_path):
+            self.tracker.discard(event.src_path)
+            self._put(event.src_path)
+
+    def on_moved(self, event):
+        # a file renamed into place is complete by construction
+        if self.ready != "created" and self._match(event, event.dest_path):
+            self.tracker.discard(event.dest_path)
+            self._put(event.dest_path)
+
+
+def _initial_scan(event_handler, path, suffix, workers, cache, resume, chunk=1000):
+    queue = event_handler.queue
+    files = scan(path, suffix, workers=workers, cache=cache)
+    try:
+        while True:
+            batch = list(islice(files, chunk))
+            if not batch:
+                break
+            batch = [file for file in batch if event_handler.matches(file)]
+            if event_handler.tracker is not None:
+                batch = event_handler.tracker.filter_ready(batch)
+            if resume:
+                batch = queue.manifest.unprocessed(queue.stage, batch)
+            queue.put_many(batch)
+    finally:
+        event_handler.scanned.set()
 
 
-def file_monitor(path, mode="from_origin", suffix=".h5"):
+def file_monitor(
+    path,
+    mode="from_origin",
+    suffix=".h5",
+    pattern=None,
+    history=10000,
+    maxsize=None,
+    policy="block",
+    spill_path=None,
+    live=None,
+    ready="auto",
+    settle=2.0,
+    coalesce=0.0,
+    max_batch=1000,
+    resume=False,
+    stage="default",
+    manifest=None,
+    workers=8,
+    scan_cache=None,
+    backend="native",
+    poll_interval=(1.0, 60.0),
+):
     """
     Start monitoring the specified path.
 
@@ -30,24 +139,160 @@ def file_monitor(path, mode="from_origin", suffix=".h5"):
         "from_origin" or "from_now"
     suffix : str
         The suffix of the files to be monitored.
-    logger : logging.Logger
-        The logger to record the events.
+    pattern : str
+        An optional ``fnmatch`` pattern the file names must also match.
+    history : int
+        The number of finished files remembered to ignore duplicate events.
+    maxsize : int
+        The high-water mark of pending files held in memory, see
+        :class:`FileQueue`. None is unbounded.
+    policy : str
+        "block", "drop_oldest" or "spill", what to do above ``maxsize``.
+    spill_path : str
+        The overflow index of the "spill" policy.
+    live : callable
+        ``live(path) -> bool`` marking the files of recent data, which are
+        claimed before the backlog, see :class:`FileQueue`.
+    ready : str
+        When a file is handed to the queue. "created" as soon as it appears,
+        "closed" once the writer closes it or it is moved into place (needs
+        inotify), "stable" once its size and mtime stop changing, and "auto"
+        picks "closed" where available and "stable" otherwise.
+    settle : int or float
+        The quiet time after the last write before a file counts as complete,
+        in seconds. Used by "stable", and by "closed" for files that already
+        exist when monitoring starts.
+    coalesce : int or float
+        If positive, events are buffered and added to the queue in batches once
+        no new file has shown up for this long, in seconds, so that bulk
+        imports reach the consumers as a few large batches.
+    max_batch : int
+        The largest batch of coalesced events added at once.
+    resume : bool
+        Skip files that ``stage`` already finished in a previous run, according
+        to the manifest.
+    stage : str
+        The name under which finished files are recorded in the manifest.
+    manifest : str or Manifest
+        The manifest recording finished files. Defaults to
+        ``.shakeflow_manifest.db`` in ``path`` when ``resume`` is True.
+    workers : int
+        The number of threads walking the directory tree for "from_origin".
+    scan_cache : str or ScanCache
+        The directory listing cache of the "from_origin" scan, see
+        :class:`ScanCache`. Defaults to the manifest database when ``resume``
+        is True.
+    backend : str
+        "native" for the platform observer of watchdog (inotify, FSEvents...),
+        or "poll" for :class:`AdaptivePollingObserver`, which also works on
+        network filesystems such as NFS or SMB.
+    poll_interval : tuple of float
+        The shortest and longest polling interval of a directory for "poll",
+        in seconds.
+
+    Returns
+    -------
+    observer : watchdog.observers.Observer or AdaptivePollingObserver
+        The observer.
+    event_handler : FileHandler
+        The event handler, whose ``queue`` holds the files to be processed.
+        For "from_origin" the queue is filled by a background scan, and
+        ``event_handler.scanned`` is set once it has finished.
 
     """
+    event_handler = _make_handler(
+        path,
+        backend,
+        mode=mode,
+        suffix=suffix,
+        pattern=pattern,
+        history=history,
+        maxsize=maxsize,
+        policy=policy,
+        spill_path=spill_path,
+        live=live,
+        ready=ready,
+        settle=settle,
+        coalesce=coalesce,
+        max_batch=max_batch,
+        resume=resume,
+        stage=stage,
+        manifest=manifest,
+        workers=workers,
+        scan_cache=scan_cache,
+    )
+    observer = _make_observer(backend, poll_interval)
+    observer.schedule(event_handler, path, recursive=True)
+
+    return observer, event_handler
+
+
+def _make_observer(backend, poll_interval):
+    if backend == "native":
+        return Observer()
+    return AdaptivePollingObserver(*poll_interval)
+
+
+def _make_handler(
+    path,
+    backend,
+    mode="from_origin",
+    suffix=".h5",
+    pattern=None,
+    history=10000,
+    maxsize=None,
+    policy="block",
+    spill_path=None,
+    live=None,
+    ready="auto",
+    settle=2.0,
+    coalesce=0.0,
+    max_batch=1000,
+    resume=False,
+    stage="default",
+    manifest=None,
+    workers=8,
+    scan_cache=None,
+):
+    if backend not in ("native", "poll"):
+        raise ValueError("backend must be 'native' or 'poll'")
+    if ready == "auto":
+        native_close = backend == "native" and _has_close_events()
+        ready = "closed" if native_close else "stable"
+    elif ready == "closed" and backend == "poll":
+        raise ValueError("ready='closed' needs backend='native'")
+    elif ready not in ("created", "closed", "stable"):
+        raise ValueError("ready must be 'auto', 'created', 'closed' or 'stable'")
+
+    if manifest is None and resume:
+        manifest = os.path.join(path, ".shakeflow_manifest.db")
+    if manifest is not None and not isinstance(manifest, Manifest):
+        manifest = Manifest(manifest)
+
+    queue = FileQueue(
+        history=history,
+        manifest=manifest,
+        stage=stage,
+        maxsize=maxsize,
+        policy=policy,
+        spill_path=spill_path,
+        live=live,
+    )
+    event_handler = FileHandler(
+        queue, suffix, ready, settle, pattern, coalesce, max_batch
+    )
+
     if mode == "from_origin":
-        files = sorted(
-            glob.glob(
-                os.path.join(path, f"**/*{suffix}"),
-                recursive=True,
-            )
-        )
+        if scan_cache is None and resume:
+            scan_cache = manifest.dbpath
+        threading.Thread(
+            target=_initial_scan,
+            args=(event_handler, path, suffix, workers, scan_cache, resume),
+            daemon=True,
+        ).start()
     elif mode == "from_now":
-        files = []
+        event_handler.scanned.set()
     else:
         raise ValueError("mode must be 'from_origin' or 'from_now'")
 
-    event_handler = FileHandler(files, suffix)
-    observer = Observer()
-    observer.schedule(event_handler, path, recursive=True)
-
-    return observer, event_handler
+    return event_handler
@@ -0,0 +1,366 @@
+import os
+import time
+import heapq
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict, deque
+
+
+class _Spill:
+    # on-disk overflow of pending files, kept sorted by SQLite
+    def __init__(self, dbpath=None):
+        if dbpath is None:
+            fd, dbpath = tempfile.mkstemp(prefix="shakeflow_spill_", suffix=".db")
+            os.close(fd)
+        self.dbpath = str(dbpath)
+        self._conn = sqlite3.connect(self.dbpath, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spill (path TEXT PRIMARY KEY, enqueued REAL)"
+        )
+        self._conn.execute("DELETE FROM spill")
+        self._conn.commit()
+        self.size = 0
+
+    def __contains__(self, path):
+        if not self.size:
+            return False
+        sql = "SELECT 1 FROM spill WHERE path = ?"
+        return self._conn.execute(sql, (path,)).fetchone() is not None
+
+    def add(self, path, enqueued):
+        self._conn.execute("INSERT INTO spill VALUES (?, ?)", (path, enqueued))
+        self._conn.commit()
+        self.size += 1
+
+    def take(self, n):
+        rows = self._conn.execute(
+            "SELECT path, enqueued FROM spill ORDER BY path LIMIT ?", (n,)
+        ).fetchall()
+        self._conn.executemany(
+            "DELETE FROM spill WHERE path = ?", [r[:1] for r in rows]
+        )
+        self._conn.commit()
+        self.size -= len(rows)
+        return rows
+
+
+class FileQueue:
+    """Ordered, deduplicated work queue of files.
+
+    Files move from *pending* to *in-flight* when they are claimed and are
+    dropped when they are acknowledged. Only a bounded history of acknowledged
+    paths is kept, so that late duplicate events are ignored without holding
+    the whole archive in memory.
+
+    Parameters
+    ----------
+    files : iterable of str
+        The files to start with.
+    history : int
+        The number of acknowledged files remembered for deduplication.
+    manifest : Manifest
+        If given, acknowledged files are recorded in it under ``stage``.
+    stage : str
+        The stage name used for the manifest records.
+    maxsize : int
+        The high-water mark of pending files kept in memory. None is unbounded.
+    policy : str
+        What happens to new files above ``maxsize``. "block" makes the producer
+        wait until a consumer claims something, "drop_oldest" discards the
+        oldest pending file, and "spill" keeps the overflow in an on-disk index
+        that refills memory as files are claimed. Spilled files are claimed
+        after the ones in memory, so the claim order is only sorted when files
+        arrive in order.
+    spill_path : str
+        The SQLite file of the "spill" policy. Defaults to a temporary file.
+    live : callable
+        ``live(path) -> bool`` sorting files into two lanes, e.g. by the time
+        in their name. Live files are claimed before the backlog of the other
+        ("backfill") files, so their latency does not grow with the backlog,
+        and workers can be reserved for them with ``lane="live"``. Live files
+        are not subject to ``maxsize``. None puts every file in the backfill
+        lane.
+    """
+
+    def __init__(
+        self,
+        files=(),
+        history=10000,
+        manifest=None,
+        stage="default",
+        maxsize=None,
+        policy="block",
+        spill_path=None,
+        live=None,
+    ):
+        if policy not in ("block", "drop_oldest", "spill"):
+            raise ValueError("policy must be 'block', 'drop_oldest' or 'spill'")
+        self.history = history
+        self.manifest = manifest
+        self.stage = stage
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.last = None
+        self.live = live
+        self._pending = []
+        self._live = []
+        self._members = set()
+        self._enqueued = {}
+        self._arrivals = deque()
+        self._in_flight = set()
+        self._done = OrderedDict()
+        self._spill = _Spill(spill_path) if policy == "spill" and maxsize else None
+        self._cond = threading.Condition()
+        self.put_many(files)
+
+    def __len__(self):
+        return len(self._pending) + len(self._live)
+
+    def __contains__(self, file):
+        return file in self._members or file in self._in_flight
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    @property
+    def spilled(self):
+        return self._spill.size if self._spill is not None else 0
+
+    @property
+    def depth(self):
+        """The number of pending files, in memory and spilled."""
+        return len(self) + self.spilled
+
+    def _depth(self, lane):
+        if lane is None:
+            return self.depth
+        if lane == "live":
+            return len(self._live)
+        if lane == "backfill":
+            return len(self._pending) + self.spilled
+        raise ValueError("lane must be None, 'live' or 'backfill'")
+
+    @property
+    def age(self):
+        """The time the oldest pending file has been waiting, in seconds."""
+        with self._cond:
+            while self._arrivals:
+                enqueued, file = self._arrivals[0]
+                if self._enqueued.get(file) == enqueued:
+                    return time.monotonic() - enqueued
+                self._arrivals.popleft()
+            return 0.0
+
+    def stats(self):
+        """Return the backlog counters as a dict."""
+        return {
+            "pending": len(self),
+            "live": len(self._live),
+            "spilled": self.spilled,
+            "in_flight": self.in_flight,
+            "dropped": self.dropped,
+            "depth": self.depth,
+            "age": self.age,
+        }
+
+    def _full(self):
+        return self.maxsize is not None and len(self) >= self.maxsize
+
+    def _ready(self, n, lane):
+        # a full queue stops the producers, so it has to satisfy the consumers
+        # even below n, e.g. if n is larger than maxsize
+        return self._depth(lane) >= n or (lane != "live" and self._full())
+
+    def _known(self, file):
+        return (
+            file in self._members
+            or file in self._in_flight
+            or file in self._done
+            or (self._spill is not None and file in self._spill)
+        )
+
+    def _is_live(self, file):
+        return self.live is not None and bool(self.live(file))
+
+    def _push(self, file, enqueued, live=None):
+        if live is None:
+            live = self._is_live(file)
+        heapq.heappush(self._live if live else self._pending, file)
+        self._members.add(file)
+        self._enqueued[file] = enqueued
+        self._arrivals.append((enqueued, file))
+
+    def _pop(self, lane=None):
+        if lane == "backfill" or (lane is None and not self._live):
+            heap = self._pending
+        else:
+            heap = self._live
+        if not heap:
+            return None
+        file = heapq.heappop(heap)
+        self._members.discard(file)
+        self._enqueued.pop(file, None)
+        self._trim_arrivals()
+        return file
+
+    def _trim_arrivals(self):
+        # drop entries of files that are no longer pending, so that the deque
+        # stays proportional to the pending files even if age is never read
+        arrivals = self._arrivals
+        while arrivals and self._enqueued.get(arrivals[0][1]) != arrivals[0][0]:
+            arrivals.popleft()
+        if len(arrivals) > 2 * len(self._enqueued) + 64:
+            self._arrivals = deque(
+                sorted((enqueued, f) for f, enqueued in self._enqueued.items())
+            )
+
+    def _refill(self):
+        if self.spilled and not self._full():
+            for file, enqueued in self._spill.take(self.maxsize - len(self)):
+                self._push(file, enqueued)
+
+    def put(self, file):
+        """Add a file, returning False if it is already known."""
+        return self.put_many([file]) == 1
+
+    def put_many(self, files):
+        """Add several files under one lock, returning the number added."""
+        added = 0
+        with self._cond:
+            for file in files:
+                if self._known(file):
+                    continue
+                live = self._is_live(file)
+                # live files bypass the backlog limit to keep their latency
+                if self._full() and not live:
+                    if self.policy == "block":
+                        self._cond.wait_for(lambda: not self._full())
+                        if self._known(file):
+                            continue
+                    elif self.policy == "drop_oldest":
+                        if self._pop("backfill") is not None:
+                            self.dropped += 1
+                    else:
+                        self._spill.add(file, time.monotonic())
+                        self.last = file
+                        added += 1
+                        continue
+                self._push(file, time.monotonic(), live)
+                self.last = file
+                added += 1
+            if added:
+                self._cond.notify_all()
+        return added
+
+    def claim(self, n=1, partial=False, lane=None):
+        """Claim the next ``n`` pending files in sorted order, live ones first.
+
+        Parameters
+        ----------
+        n : int
+            The number of files to claim.
+        partial : bool
+            If False, nothing is claimed unless ``n`` files are pending, or
+            the queue is full at ``maxsize``.
+        lane : str
+            "live" or "backfill" to claim from that lane only, for workers
+            reserved for one of them. None takes both.
+
+        Returns
+        -------
+        files : list of str
+            The claimed files, now in-flight until acknowledged or released.
+        """
+        with self._cond:
+            if not partial and not self._ready(n, lane):
+                return []
+            return self._take(n, lane)
+
+    def _take(self, n, lane=None):
+        files = []
+        while len(files) < n:
+            self._refill()
+            file = self._pop(lane)
+            if file is None:
+                break
+            self._in_flight.add(file)
+            files.append(file)
+        self._refill()
+        if files:
+            self._cond.notify_all()
+        return files
+
+    def get_batch(self, n=1, timeout=None, partial=False, lane=None):
+        """Wait until ``n`` files are pending and claim them.
+
+        A queue that is full at ``maxsize`` hands out the files it holds even
+        if they are fewer than ``n``, since no more can arrive until some are
+        claimed.
+
+        Parameters
+        ----------
+        n : int
+            The number of files to claim.
+        timeout : int or float
+            The maximum waiting time, in seconds. None waits forever.
+        partial : bool
+            If True, the files pending at the timeout are claimed even if
+            fewer than ``n``.
+        lane : str
+            "live", "backfill" or None for both, see :meth:`claim`.
+
+        Returns
+        -------
+        files : list of str
+            The claimed files, empty if the timeout expired first.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready(n, lane), timeout):
+                return self._take(n, lane) if partial else []
+            return self._take(n, lane)
+
+    async def batches(self, n=1, poll=1.0, lane=None):
+        """Asynchronously iterate over batches of ``n`` claimed files.
+
+        The waiting happens in the default executor, woken at least every
+        ``poll`` seconds so that the iteration can be cancelled. Files claimed
+        by a wait that is cancelled are released again.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.run_in_executor(None, self.get_batch, n, poll, False, lane)
+            try:
+                files = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # hand back whatever the worker thread claims after cancellation
+                future.add_done_callback(
+                    lambda f: f.cancelled() or self.release(f.result())
+                )
+                raise
+            if files:
+                yield files
+
+    def ack(self, files):
+        """Mark claimed files as finished."""
+        with self._cond:
+            for file in files:
+                self._in_flight.discard(file)
+                self._done[file] = None
+                self._done.move_to_end(file)
+            while len(self._done) > self.history:
+                self._done.popitem(last=False)
+        if self.manifest is not None:
+            self.manifest.record(self.stage, files)
+
+    def release(self, files):
+        """Return claimed files to the pending queue."""
+        with self._cond:
+            for file in files:
+                if file in self._in_flight:
+                    self._in_flight.discard(file)
+                    self._push(file, time.monotonic())
+            self._cond.notify_all()
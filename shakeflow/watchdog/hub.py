@@ -0,0 +1,101 @@
+import os
+from watchdog.events import FileSystemEventHandler
+
+from .file_monitor import _make_handler, _make_observer
+
+
+def _under(path, root):
+    return path == root or path.startswith(os.path.join(root, ""))
+
+
+class _Dispatcher(FileSystemEventHandler):
+    def __init__(self, routes):
+        self.routes = routes
+
+    def dispatch(self, event):
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        for root, handler in self.routes:
+            if any(path and _under(path, root) for path in paths):
+                handler.dispatch(event)
+
+
+class MonitorHub:
+    """Serve many file monitoring routes from a single observer.
+
+    Each route has its own :class:`FileHandler` and queue, but all routes
+    share one observer thread, and nested or repeated paths share one
+    recursive watch on their common root. Routes are added before
+    :meth:`start`. Afterwards only paths inside an already watched root can
+    be added.
+
+    Parameters
+    ----------
+    backend : str
+        "native" or "poll", see :func:`file_monitor`.
+    poll_interval : tuple of float
+        The polling intervals for "poll", see :func:`file_monitor`.
+
+    Examples
+    --------
+    >>> hub = MonitorHub()
+    >>> db = hub.route("./download", suffix=".h5", stage="s1_build_db")
+    >>> cc = hub.route("./database", suffix=".h5", stage="s2_cc_stack")
+    >>> hub.start()
+    >>> files = db.get_batch(3)
+    """
+
+    def __init__(self, backend="native", poll_interval=(1.0, 60.0)):
+        self.backend = backend
+        self.routes = []
+        self.roots = []
+        self.observer = _make_observer(backend, poll_interval)
+        self._dispatcher = _Dispatcher(self.routes)
+        self._started = False
+
+    def route(self, path, **kwargs):
+        """
+        Add a route and return its handler.
+
+        Parameters
+        ----------
+        path : str
+            The path to be monitored.
+        **kwargs
+            The options of :func:`file_monitor`, such as ``mode``, ``suffix``,
+            ``pattern``, ``ready`` or ``resume``, except the observer options.
+
+        Returns
+        -------
+        event_handler : FileHandler
+            The handler of the route, with its own ``queue``.
+
+        Raises
+        ------
+        RuntimeError
+            If the hub was started and ``path`` is outside its roots, which
+            would need a new watch.
+        """
+        path = os.path.abspath(path)
+        watched = any(_under(path, root) for root in self.roots)
+        if self._started and not watched:
+            raise RuntimeError(
+                f"{path} is not inside a watched root, add routes before start()"
+            )
+        event_handler = _make_handler(path, self.backend, **kwargs)
+        self.routes.append((path, event_handler))
+        if not watched:
+            self.roots[:] = [root for root in self.roots if not _under(root, path)]
+            self.roots.append(path)
+        return event_handler
+
+    def start(self):
+        for root in self.roots:
+            self.observer.schedule(self._dispatcher, root, recursive=True)
+        self._started = True
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+
+    def join(self):
+        self.observer.join()
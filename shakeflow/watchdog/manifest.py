@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+
+
+class Manifest:
+    """Durable record of the files each stage has finished.
+
+    Entries are keyed by stage and path and remember the size and mtime the
+    file had when it was finished, so a file that is rewritten afterwards is
+    processed again.
+
+    Parameters
+    ----------
+    dbpath : str
+        The SQLite database file, created if missing.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, dbpath):
+        self.dbpath = str(dbpath)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.dbpath, check_same_thread=False, isolation_level=None
+        )
+        # a rollback journal, since WAL does not work on network filesystems
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS finished ("
+            "stage TEXT, path TEXT, size INTEGER, mtime_ns INTEGER, "
+            "PRIMARY KEY (stage, path))"
+        )
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def record(self, stage, paths):
+        """Mark files as finished by a stage."""
+        rows = []
+        for path in paths:
+            signature = self._signature(path)
+            if signature is not None:
+                rows.append((stage, path) + signature)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO finished VALUES (?, ?, ?, ?)", rows
+            )
+
+    def forget(self, stage, paths=None):
+        """Drop the records of some files, or of the whole stage."""
+        with self._lock:
+            if paths is None:
+                self._conn.execute("DELETE FROM finished WHERE stage = ?", (stage,))
+            else:
+                self._conn.executemany(
+                    "DELETE FROM finished WHERE stage = ? AND path = ?",
+                    [(stage, path) for path in paths],
+                )
+
+    def unprocessed(self, stage, paths):
+        """Yield the paths a stage has not finished in their current state."""
+        paths = list(paths)
+        for i in range(0, len(paths), self.chunk_size):
+            chunk = paths[i : i + self.chunk_size]
+            marks = ",".join("?" * len(chunk))
+            with self._lock:
+                done = {
+                    path: (size, mtime_ns)
+                    for path, size, mtime_ns in self._conn.execute(
+                        "SELECT path, size, mtime_ns FROM finished "
+                        f"WHERE stage = ? AND path IN ({marks})",
+                        [stage] + chunk,
+                    )
+                }
+            for path in chunk:
+                if path not in done or done[path] != self._signature(path):
+                    yield path
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,148 @@
+import os
+import time
+import heapq
+import threading
+from watchdog.events import DirCreatedEvent, FileCreatedEvent
+
+
+class AdaptivePollingObserver(threading.Thread):
+    """Polling observer for filesystems without reliable change events.
+
+    Instead of stat'ing every file on each round like watchdog's
+    ``PollingObserver``, it keeps an index of directory mtimes and only lists
+    a directory again when its mtime has changed, i.e. when entries were
+    added or removed. Each directory is polled on its own schedule: the
+    interval is reset to ``min_interval`` when something arrives and doubles
+    up to ``max_interval`` while it stays unchanged, so busy directories are
+    watched closely and old parts of an archive are left alone.
+
+    Only creations are reported, as ``FileCreatedEvent`` and
+    ``DirCreatedEvent``. Files present when the observer starts are not
+    reported. Watches must be scheduled before :meth:`start`.
+
+    Parameters
+    ----------
+    min_interval : int or float
+        The shortest polling interval of a directory, in seconds.
+    max_interval : int or float
+        The longest polling interval of a directory, in seconds.
+    """
+
+    # directories modified this recently are listed again on the next poll,
+    # since a coarse mtime may not change for an entry added in the same tick
+    racy = 2.0
+
+    def __init__(self, min_interval=1.0, max_interval=60.0):
+        super().__init__(daemon=True)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._watches = []
+        self._index = {}
+        self._heap = []
+        self._stopped = threading.Event()
+
+    def schedule(self, event_handler, path, recursive=True):
+        if self.is_alive():
+            raise RuntimeError("watches must be scheduled before start()")
+        self._watches.append((event_handler, str(path), recursive))
+
+    def stop(self):
+        self._stopped.set()
+
+    @staticmethod
+    def _list(path):
+        files, subdirs = set(), set()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(entry.name)
+                else:
+                    files.add(entry.name)
+        return files, subdirs
+
+    def _push(self, key, interval):
+        due = time.monotonic() + interval
+        self._index[key][3:] = [interval, due]
+        heapq.heappush(self._heap, (due, key))
+
+    def _add_tree(self, watch, path, emit):
+        handler, _, recursive = self._watches[watch]
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                files, subdirs = self._list(directory)
+            except OSError:
+                continue
+            key = (watch, directory)
+            self._index[key] = [mtime_ns, files, subdirs, None, None]
+            self._push(key, self.min_interval)
+            if emit:
+                for name in sorted(files):
+                    handler.dispatch(FileCreatedEvent(os.path.join(directory, name)))
+            if recursive:
+                for name in sorted(subdirs, reverse=True):
+                    subdir = os.path.join(directory, name)
+                    if emit:
+                        handler.dispatch(DirCreatedEvent(subdir))
+                    stack.append(subdir)
+
+    def _drop_tree(self, watch, path):
+        prefix = os.path.join(path, "")
+        for key in [
+            k
+            for k in self._index
+            if k[0] == watch and (k[1] == path or k[1].startswith(prefix))
+        ]:
+            del self._index[key]
+
+    def _check(self, key):
+        watch, directory = key
+        handler, _, recursive = self._watches[watch]
+        entry = self._index[key]
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            self._drop_tree(watch, directory)
+            return
+        racy = time.time_ns() - mtime_ns < self.racy * 1e9
+        if mtime_ns == entry[0] and not racy:
+            self._push(key, min(entry[3] * 2, self.max_interval))
+            return
+        try:
+            files, subdirs = self._list(directory)
+        except OSError:
+            self._drop_tree(watch, directory)
+            return
+        new_files = files - entry[1]
+        new_subdirs = subdirs - entry[2]
+        for name in entry[2] - subdirs:
+            self._drop_tree(watch, os.path.join(directory, name))
+        entry[:3] = [mtime_ns, files, subdirs]
+        changed = bool(new_files or new_subdirs)
+        self._push(key, self.min_interval if changed else entry[3])
+        for name in sorted(new_files):
+            handler.dispatch(FileCreatedEvent(os.path.join(directory, name)))
+        if recursive:
+            for name in sorted(new_subdirs):
+                subdir = os.path.join(directory, name)
+                handler.dispatch(DirCreatedEvent(subdir))
+                self._add_tree(watch, subdir, emit=True)
+
+    def run(self):
+        for watch, (_, path, _) in enumerate(self._watches):
+            self._add_tree(watch, path, emit=False)
+        while not self._stopped.is_set():
+            timeout = self.max_interval
+            if self._heap:
+                timeout = max(self._heap[0][0] - time.monotonic(), 0)
+            if self._stopped.wait(timeout):
+                break
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, key = heapq.heappop(self._heap)
+                entry = self._index.get(key)
+                # skip entries that were dropped or rescheduled since
+                if entry is not None and entry[4] == due:
+                    self._check(key)
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+
+
+class StabilityTracker:
+    """Report files once their size and mtime have stopped changing.
+
+    Candidates are stat'ed every ``interval`` seconds by a daemon thread that
+    only runs while there is something to check. A file is ready when its
+    ``(size, mtime)`` is unchanged since the previous check and its mtime is
+    at least ``settle`` seconds old.
+
+    Parameters
+    ----------
+    callback : callable
+        Called with the path of each file that becomes ready.
+    settle : int or float
+        The quiet time after the last write, in seconds.
+    interval : int or float
+        The time between two checks, in seconds. Defaults to ``settle / 2``.
+    """
+
+    def __init__(self, callback, settle=2.0, interval=None):
+        self.callback = callback
+        self.settle = settle
+        self.interval = interval if interval is not None else settle / 2
+        self._candidates = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._candidates)
+
+    def add(self, path):
+        with self._lock:
+            self._candidates.setdefault(path, None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def discard(self, path):
+        with self._lock:
+            self._candidates.pop(path, None)
+
+    def filter_ready(self, paths):
+        """Return the paths that are already settled and track the rest."""
+        now = time.time()
+        ready = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime >= self.settle:
+                ready.append(path)
+            else:
+                self.add(path)
+        return ready
+
+    def poll(self):
+        """Check all candidates once and report the ready ones."""
+        now = time.time()
+        with self._lock:
+            items = list(self._candidates.items())
+        ready = []
+        for path, last in items:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self.discard(path)
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if now - st.st_mtime >= self.settle and last in (None, signature):
+                ready.append(path)
+            else:
+                with self._lock:
+                    if path in self._candidates:
+                        self._candidates[path] = signature
+        for path in ready:
+            with self._lock:
+                if self._candidates.pop(path, False) is False:
+                    continue
+            self.callback(path)
+        return ready
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.poll()
+            with self._lock:
+                if not self._candidates:
+                    self._thread = None
+                    return
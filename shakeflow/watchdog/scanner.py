@@ -0,0 +1,148 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class ScanCache:
+    """Per-directory listing cache for :func:`scan`.
+
+    A directory whose mtime is unchanged since the previous scan has the same
+    entries, so its cached listing is reused instead of reading it again. Its
+    subdirectories are still visited, since their own changes do not touch
+    the mtime of the parent. Listings of directories modified less than
+    ``racy`` seconds before they were read are not cached, since filesystems
+    with coarse timestamps, such as NFS or SMB, give a file added within the
+    same tick the same mtime.
+
+    Parameters
+    ----------
+    dbpath : str
+        The SQLite database file, created if missing.
+    """
+
+    racy = 2.0
+
+    def __init__(self, dbpath):
+        self.dbpath = str(dbpath)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._updates = []
+        conn = self._conn()
+        # a rollback journal, since WAL does not work on network filesystems
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_cache ("
+            "path TEXT, suffix TEXT, mtime_ns INTEGER, files TEXT, subdirs TEXT, "
+            "PRIMARY KEY (path, suffix))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.dbpath, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, path, suffix, mtime_ns):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT files, subdirs FROM scan_cache "
+                "WHERE path = ? AND suffix = ? AND mtime_ns = ?",
+                (path, suffix, mtime_ns),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return [name for name in row[0].split("\n") if name], [
+            name for name in row[1].split("\n") if name
+        ]
+
+    def put(self, path, suffix, mtime_ns, files, subdirs):
+        if time.time_ns() - mtime_ns < self.racy * 1e9:
+            return
+        with self._lock:
+            self._updates.append(
+                (path, suffix, mtime_ns, "\n".join(files), "\n".join(subdirs))
+            )
+
+    def flush(self):
+        with self._lock:
+            updates, self._updates = self._updates, []
+        if updates:
+            self._conn().executemany(
+                "INSERT OR REPLACE INTO scan_cache VALUES (?, ?, ?, ?, ?)", updates
+            )
+
+
+def _list_dir(path, suffix, cache):
+    mtime_ns = os.stat(path).st_mtime_ns
+    if cache is not None:
+        listing = cache.get(path, suffix, mtime_ns)
+        if listing is not None:
+            return listing
+    files, subdirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.name.endswith(suffix):
+                files.append(entry.name)
+    files.sort()
+    subdirs.sort()
+    if cache is not None:
+        cache.put(path, suffix, mtime_ns, files, subdirs)
+    return files, subdirs
+
+
+def scan(path, suffix=".h5", workers=8, cache=None):
+    """
+    Recursively find files under a path, yielding them while walking.
+
+    Directories are listed concurrently by a thread pool, which hides the
+    per-directory latency of network filesystems. Files are yielded in sorted
+    order within a directory, but directories finish in any order. Hidden
+    entries are skipped, as with ``glob``.
+
+    Parameters
+    ----------
+    path : str
+        The root directory.
+    suffix : str
+        The suffix of the files to be found.
+    workers : int
+        The number of threads listing directories.
+    cache : str or ScanCache
+        Listing cache reused between scans, see :class:`ScanCache`.
+
+    Yields
+    ------
+    file : str
+        The path of a matching file.
+    """
+    if cache is not None and not isinstance(cache, ScanCache):
+        cache = ScanCache(cache)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_list_dir, path, suffix, cache): path}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = futures.pop(future)
+                try:
+                    files, subdirs = future.result()
+                except OSError:
+                    continue
+                for name in subdirs:
+                    subdir = os.path.join(directory, name)
+                    futures[pool.submit(_list_dir, subdir, suffix, cache)] = subdir
+                for name in files:
+                    yield os.path.join(directory, name)
+
+    if cache is not None:
+        cache.flush()
@@ -1,53 +1,388 @@
+import math
 import time
+import heapq
+import logging
+import itertools
 import threading
+from collections.abc import Sequence
 from obspy import UTCDateTime
 
+from .window_store import WindowStore
+
+logger = logging.getLogger(__name__)
+
+
+class WindowRange(Sequence):
+    """Lazy sequence of the start times of regularly spaced windows."""
+
+    def __init__(self, origin_ns, interval_ns, count):
+        self.origin_ns = origin_ns
+        self.interval_ns = interval_ns
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("window index out of range")
+        return UTCDateTime(ns=self.origin_ns + index * self.interval_ns)
+
 
 class EventHandler:
-    def __init__(self, starttime, time_interval, time_lagging):
-        self.starttime = starttime
+    def __init__(
+        self,
+        starttime,
+        time_interval,
+        time_lagging,
+        max_in_flight=None,
+        probe=None,
+        probe_interval=60,
+        live_windows=None,
+        live_share=0.0,
+        probe_timeout=30,
+    ):
         self.time_interval = time_interval
         self.time_lagging = time_lagging
-        self.times = [str(starttime)]
+        self.max_in_flight = max_in_flight
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.probed_at = -math.inf
+        self._probing = None
+        self.live_windows = live_windows
+        self.reserved = 0
+        if max_in_flight is not None and live_windows is not None:
+            self.reserved = math.ceil(live_share * max_in_flight)
+        self._live = set()
         self.running = True
+        self.store = WindowStore(
+            UTCDateTime(starttime).ns, int(round(time_interval * 1e9))
+        )
+        self.store.extend(1)
+        self.parents = []
+        self._cond = threading.Condition()
+
+    @property
+    def origin(self):
+        return UTCDateTime(ns=self.store.origin_ns)
+
+    @property
+    def starttime(self):
+        """The start time of the latest due window."""
+        return UTCDateTime(ns=self.store.start_ns(self.store.count - 1))
+
+    @property
+    def times(self):
+        """The start times of all due windows, as a lazy sequence."""
+        store = self.store
+        return WindowRange(store.origin_ns, store.interval_ns, store.count)
+
+    @property
+    def pending(self):
+        """The number of due windows that have not been claimed."""
+        return self.store.pending
+
+    @property
+    def in_flight(self):
+        return self.store.in_flight
+
+    def next_deadline(self):
+        """The epoch time at which the next window becomes due or is probed."""
+        start = self.starttime + self.time_interval
+        deadline = (start + self.time_lagging).timestamp
+        if self.probe is not None:
+            end = (start + self.time_interval).timestamp
+            retry = self.probed_at + self.probe_interval
+            deadline = min(deadline, max(end, retry))
+        return deadline
+
+    def _probe(self, start):
+        """Run the probe on its own thread, for at most ``probe_timeout``."""
+        self.probed_at = time.time()
+        if self._probing is not None and self._probing.is_alive():
+            # a hung probe still holds its thread, do not pile up more
+            return False
+        result = []
+
+        def probe():
+            try:
+                result.append(bool(self.probe(start, start + self.time_interval)))
+            except Exception:
+                logger.exception("Probe of the window %s failed", start)
+
+        self._probing = threading.Thread(target=probe, daemon=True)
+        self._probing.start()
+        self._probing.join(self.probe_timeout)
+        if self._probing.is_alive():
+            logger.warning(
+                "Probe of the window %s timed out after %s s",
+                start,
+                self.probe_timeout,
+            )
+        return bool(result and result[0])
+
+    def fire(self, now):
+        """Mark every window that is due at ``now`` at once.
+
+        Windows are due ``time_lagging`` after their start, or, with a
+        ``probe``, as soon as they have ended and the probe reports their data
+        as available.
+        """
+        elapsed = now - self.origin - self.time_lagging
+        count = max(math.floor(elapsed / self.time_interval) + 1, self.store.count)
+        if self.probe is not None:
+            while True:
+                start = UTCDateTime(ns=self.store.start_ns(count))
+                if now < start + self.time_interval or not self._probe(start):
+                    break
+                count += 1
+        with self._cond:
+            if count > self.store.count:
+                self.store.extend(count)
+                self._cond.notify_all()
+
+    def _index(self, time):
+        return self.store.index(UTCDateTime(time).ns)
+
+    @property
+    def live_start(self):
+        """The index of the oldest live window."""
+        if self.live_windows is None:
+            return self.store.count
+        return max(self.store.count - self.live_windows, 0)
+
+    def _next(self, lane=None):
+        """The index of the window to claim next in ``lane``, or None."""
+        if lane not in (None, "live", "backfill"):
+            raise ValueError("lane must be None, 'live' or 'backfill'")
+        store = self.store
+        free = math.inf
+        if self.max_in_flight is not None:
+            free = self.max_in_flight - store.in_flight
+        if free <= 0:
+            return None
+        if lane != "backfill":
+            for index in range(store.count - 1, self.live_start - 1, -1):
+                if not store.is_claimed(index):
+                    return index
+            if lane == "live":
+                return None
+        # keep the share of live work free from backfill
+        if free <= self.reserved - len(self._live):
+            return None
+        index = store.next_pending()
+        if index is None or index >= self.live_start:
+            return None
+        return index
+
+    def next_pending(self):
+        """The start time of the window claimed next, or None."""
+        with self._cond:
+            index = self._next()
+        return None if index is None else UTCDateTime(ns=self.store.start_ns(index))
 
-    def trigger(self):
-        while self.running:
-            current_utc_time = UTCDateTime()
-            if (
-                current_utc_time
-                > self.starttime + self.time_interval + self.time_lagging
-            ):
-                self.times.append(str(self.starttime + self.time_interval))
-                self.starttime += self.time_interval
-            time.sleep(1)
+    def claim(self, n=1, lane=None):
+        """
+        Claim up to ``n`` due windows.
+
+        Live windows, the last ``live_windows`` ones, come first and newest
+        first, then the backlog oldest first. No more than ``max_in_flight``
+        windows are claimed at the same time, of which the backlog may not
+        take the share reserved for live windows.
+
+        Parameters
+        ----------
+        n : int
+            The largest number of windows to claim.
+        lane : str
+            "live" or "backfill" to claim from that lane only, for workers
+            reserved for one of them. None takes both.
+
+        Returns
+        -------
+        times : list of obspy.UTCDateTime
+            The start times of the claimed windows.
+        """
+        with self._cond:
+            indices = []
+            while len(indices) < n:
+                index = self._next(lane)
+                if index is None:
+                    break
+                self.store.claim_index(index)
+                if index >= self.live_start:
+                    self._live.add(index)
+                indices.append(index)
+            return [UTCDateTime(ns=self.store.start_ns(i)) for i in indices]
+
+    def get_batch(self, n=1, timeout=None, lane=None):
+        """Wait until a window can be claimed and claim up to ``n`` of them."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._next(lane) is not None, timeout)
+            return self.claim(n, lane)
+
+    def ack(self, times):
+        """Mark claimed windows as finished."""
+        with self._cond:
+            for t in times:
+                self.store.ack(self._index(t))
+                self._live.discard(self._index(t))
+            self._cond.notify_all()
+        for parent in self.parents:
+            parent.update()
+
+    def release(self, times):
+        """Return claimed windows so that they are claimed again."""
+        with self._cond:
+            for t in times:
+                self.store.release(self._index(t))
+                self._live.discard(self._index(t))
+            self._cond.notify_all()
+
+    def cascade(self, time_interval, max_in_flight=None):
+        """
+        Derive a coarser schedule that follows the completion of this one.
+
+        A window of the returned handler becomes due once every window of
+        this handler inside it has been acknowledged. Windows are aligned to
+        the start time of this handler, and a coarse window is only released
+        after all earlier ones, so that e.g. daily stacks run exactly once and
+        in order. Cascades can be chained (10 min -> 1 hour -> 1 day).
+
+        Parameters
+        ----------
+        time_interval : int or float
+            The coarse time interval, a multiple of this one, in seconds.
+        max_in_flight : int
+            The largest number of coarse windows claimed at the same time.
+
+        Returns
+        -------
+        event_handler : CascadeHandler
+            The coarse handler, claimed and acknowledged like this one.
+        """
+        return CascadeHandler(self, time_interval, max_in_flight)
 
     def stop(self):
         self.running = False
 
 
+class CascadeHandler(EventHandler):
+    def __init__(self, child, time_interval, max_in_flight=None):
+        factor = time_interval / child.time_interval
+        if factor < 1 or abs(factor - round(factor)) > 1e-9:
+            raise ValueError("time_interval must be a multiple of the child interval")
+        super().__init__(child.origin, time_interval, 0, max_in_flight)
+        self.child = child
+        self.factor = round(factor)
+        self.store = WindowStore(child.store.origin_ns, self.store.interval_ns)
+        child.parents.append(self)
+        self.update()
+
+    def dependencies(self, time):
+        """The start times of the child windows that make up a window."""
+        first = self._index(time) * self.factor
+        return self.child.times[first : first + self.factor]
+
+    def next_deadline(self):
+        return math.inf
+
+    def fire(self, now):
+        pass
+
+    def update(self):
+        """Release the coarse windows whose child windows are all done."""
+        count = self.child.store.done_prefix // self.factor
+        with self._cond:
+            if count > self.store.count:
+                self.store.extend(count)
+                self._cond.notify_all()
+
+
 class TimeMonitor:
+    """Run the schedules of many event handlers on one thread.
+
+    The thread sleeps until the earliest deadline of all scheduled handlers
+    instead of polling, and wakes up immediately when a handler is added or
+    the monitor is stopped.
+    """
+
+    # upper bound of one sleep, so that wall clock adjustments are picked up
+    max_sleep = 600
+
     def __init__(self):
         self.thread = None
+        self.handlers = []
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
 
     def schedule(self, event_handler):
-        self.event_handler = event_handler
-        self.thread = threading.Thread(target=self.event_handler.trigger)
+        with self._lock:
+            self.handlers.append(event_handler)
+            self._push(event_handler)
+        self._wakeup.set()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run)
+
+    def _push(self, event_handler):
+        entry = (event_handler.next_deadline(), next(self._counter), event_handler)
+        heapq.heappush(self._heap, entry)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                timeout = self.max_sleep
+                if self._heap:
+                    timeout = min(max(self._heap[0][0] - time.time(), 0), timeout)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            now = time.time()
+            with self._lock:
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+            # fire outside the lock, since probes may take up to their timeout
+            for event_handler in due:
+                if event_handler.running:
+                    event_handler.fire(UTCDateTime(now))
+                    with self._lock:
+                        self._push(event_handler)
 
     def start(self):
         if self.thread:
             self.thread.start()
 
     def stop(self):
-        if self.thread and self.event_handler:
-            self.event_handler.stop()
+        for event_handler in self.handlers:
+            event_handler.stop()
+        self._stopped.set()
+        self._wakeup.set()
 
     def join(self):
         if self.thread:
             self.thread.join()
 
 
-def time_monitor(starttime, time_interval=60 * 60, time_lagging=0):
+def time_monitor(
+    starttime,
+    time_interval=60 * 60,
+    time_lagging=0,
+    monitor=None,
+    max_in_flight=None,
+    probe=None,
+    probe_interval=60,
+    live_windows=None,
+    live_share=0.0,
+    probe_timeout=30,
+):
     """Start monitoring the specified time.
 
     Parameters
@@ -59,16 +394,50 @@ def time_monitor(starttime, time_interval=60 * 60, time_lagging=0):
     time_lagging : int or float
         The lagging time between the current time and the last time segment,
         in seconds.
+    monitor : TimeMonitor
+        An existing monitor to add this schedule to, so that many schedules
+        share one thread. A new one is created by default.
+    max_in_flight : int
+        The largest number of windows claimed at the same time, which caps the
+        parallelism of a backfill. None is unbounded.
+    probe : callable
+        ``probe(starttime, endtime) -> bool`` reporting whether the data of a
+        window is complete, e.g. a cheap metadata query or a local file check.
+        If given, a window is due as soon as it has ended and the probe
+        succeeds, and ``time_lagging`` only bounds how long it may take.
+    probe_interval : int or float
+        The time between two probes of the same window, in seconds.
+    live_windows : int
+        The number of latest due windows claimed before the backlog, newest
+        first, so that real-time latency does not depend on the backlog.
+        None claims every window oldest first.
+    live_share : float
+        The share of ``max_in_flight`` that backfill windows may not take,
+        kept for live windows.
+    probe_timeout : int or float
+        How long the monitor thread waits for one probe, in seconds. A probe
+        that fails, raises or times out is logged and counts as not ready,
+        and a hung probe is not started again until it returns.
 
     Returns
     -------
-    observer : watchdog.observers.Observer
+    observer : TimeMonitor
         The observer.
     event_handler : EventHandler
         The event handler.
     """
-    event_handler = EventHandler(starttime, time_interval, time_lagging)
-    observer = TimeMonitor()
+    event_handler = EventHandler(
+        starttime,
+        time_interval,
+        time_lagging,
+        max_in_flight,
+        probe,
+        probe_interval,
+        live_windows,
+        live_share,
+        probe_timeout,
+    )
+    observer = monitor if monitor is not None else TimeMonitor()
     observer.schedule(event_handler)
 
     return observer, event_handler
@@ -0,0 +1,130 @@
+class WindowStore:
+    """Compact state of regularly spaced time windows.
+
+    Window ``i`` starts at ``origin_ns + i * interval_ns`` (epoch nanoseconds),
+    so start times are computed rather than stored. Two bitmaps record which
+    windows are claimed and which are done, and the fully done prefix is
+    trimmed as it grows, so memory stays proportional to the span of
+    unfinished windows rather than to the whole history.
+
+    Parameters
+    ----------
+    origin_ns : int
+        The start of window 0, in epoch nanoseconds.
+    interval_ns : int
+        The spacing of the windows, in nanoseconds.
+    """
+
+    # number of bytes of fully done windows dropped at once
+    trim_bytes = 4096
+
+    def __init__(self, origin_ns, interval_ns):
+        self.origin_ns = origin_ns
+        self.interval_ns = interval_ns
+        self.count = 0
+        self.claimed_count = 0
+        self.done_count = 0
+        self._base = 0
+        self._cursor = 0
+        self._first_undone = 0
+        self._claimed = bytearray()
+        self._done = bytearray()
+
+    @property
+    def pending(self):
+        return self.count - self.claimed_count
+
+    @property
+    def in_flight(self):
+        return self.claimed_count - self.done_count
+
+    @property
+    def done_prefix(self):
+        """The number of leading windows that are all done."""
+        return self._first_undone
+
+    def start_ns(self, index):
+        return self.origin_ns + index * self.interval_ns
+
+    def index(self, start_ns):
+        return round((start_ns - self.origin_ns) / self.interval_ns)
+
+    def extend(self, count):
+        """Make windows ``0 .. count - 1`` available."""
+        if count <= self.count:
+            return
+        self.count = count
+        size = (count - self._base + 7) >> 3
+        grow = size - len(self._claimed)
+        if grow > 0:
+            self._claimed.extend(bytes(grow))
+            self._done.extend(bytes(grow))
+
+    @staticmethod
+    def _get(bitmap, i):
+        return bitmap[i >> 3] >> (i & 7) & 1
+
+    @staticmethod
+    def _set(bitmap, i, value):
+        if value:
+            bitmap[i >> 3] |= 1 << (i & 7)
+        else:
+            bitmap[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def is_claimed(self, index):
+        if index < self._base:
+            return True
+        return index < self.count and bool(self._get(self._claimed, index - self._base))
+
+    def is_done(self, index):
+        if index < self._base:
+            return True
+        return index < self.count and bool(self._get(self._done, index - self._base))
+
+    def next_pending(self):
+        """Return the oldest unclaimed window, or None, in amortized O(1)."""
+        while self._cursor < self.count and self.is_claimed(self._cursor):
+            self._cursor += 1
+        return self._cursor if self._cursor < self.count else None
+
+    def claim(self):
+        """Claim the oldest unclaimed window and return its index, or None."""
+        index = self.next_pending()
+        if index is not None:
+            self._set(self._claimed, index - self._base, True)
+            self.claimed_count += 1
+            self._cursor += 1
+        return index
+
+    def claim_index(self, index):
+        """Claim a given unclaimed window, returning False if it is not one."""
+        if index >= self.count or self.is_claimed(index):
+            return False
+        self._set(self._claimed, index - self._base, True)
+        self.claimed_count += 1
+        return True
+
+    def ack(self, index):
+        """Mark a claimed window as done."""
+        if not self.is_claimed(index) or self.is_done(index):
+            return
+        self._set(self._done, index - self._base, True)
+        self.done_count += 1
+        while self._first_undone < self.count and self.is_done(self._first_undone):
+            self._first_undone += 1
+        self._trim()
+
+    def release(self, index):
+        """Return a claimed window that is not done to the unclaimed ones."""
+        if not self.is_claimed(index) or self.is_done(index):
+            return
+        self._set(self._claimed, index - self._base, False)
+        self.claimed_count -= 1
+        self._cursor = min(self._cursor, index)
+
+    def _trim(self):
+        drop = (self._first_undone - self._base) >> 3
+        if drop >= self.trim_bytes:
+            del self._claimed[:drop]
+            del self._done[:drop]
+            self._base += drop << 3
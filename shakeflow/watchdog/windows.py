@@ -0,0 +1,210 @@
+import os
+import math
+import time
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+Window = namedtuple("Window", ["starttime", "files", "complete"])
+
+
+def _parse(path, time_format):
+    try:
+        t = datetime.strptime(os.path.basename(path), time_format)
+    except ValueError:
+        return None
+    return t.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _epoch(t):
+    # epoch seconds of a number, datetime or UTCDateTime
+    if isinstance(t, datetime):
+        return t.replace(tzinfo=t.tzinfo or timezone.utc).timestamp()
+    return float(getattr(t, "timestamp", t))
+
+
+def recent(time_format, age):
+    """
+    Make a ``live`` test of :class:`FileQueue` from the time in file names.
+
+    Parameters
+    ----------
+    time_format : str
+        The ``strptime`` format of the file names, in UTC.
+    age : int or float
+        Files starting less than this long ago are live, in seconds.
+
+    Returns
+    -------
+    live : callable
+        ``live(path) -> bool``.
+    """
+
+    def live(path):
+        t = _parse(path, time_format)
+        return t is not None and time.time() - t < age
+
+    return live
+
+
+class TimeWindows:
+    """Group the files of a queue into gap-checked time windows.
+
+    The start time of each file is parsed from its name. Files are claimed
+    from the queue as they arrive and collected into windows that start at
+    ``origin`` plus multiples of ``window_length``. A window is handed out as
+    soon as every ``file_length`` slot in it is filled, or incomplete once it
+    has been waiting for ``wait`` seconds.
+
+    Parameters
+    ----------
+    queue : FileQueue
+        The queue to take files from.
+    time_format : str
+        The ``strptime`` format of the file names, in UTC,
+        e.g. "%Y_%m_%d_%H_%M_%S_%f_EHZ.h5".
+    file_length : int or float
+        The time span of one file, in seconds.
+    window_length : int or float
+        The time span of one window, in seconds.
+    wait : int or float
+        How long an incomplete window is held back, in seconds.
+    live : int or float
+        If given, ready windows starting less than this long ago are handed
+        out first, newest first, ahead of older ones, in seconds.
+    origin : float, datetime or obspy.UTCDateTime
+        A start time of the window grid. Defaults to the epoch shifted by the
+        offset of the first file from multiples of ``file_length``, so that
+        files not aligned to the epoch still fill whole windows.
+    max_files : int
+        The largest number of files claimed into windows that are not handed
+        out yet, so that the backpressure of the queue still applies.
+        Defaults to the files of 16 windows.
+
+    Files whose name does not match ``time_format`` or that fall outside the
+    slots of a window are acknowledged, so that they do not stay claimed,
+    and the latest ones are kept in ``unmatched``.
+    """
+
+    def __init__(
+        self,
+        queue,
+        time_format,
+        file_length,
+        window_length,
+        wait=600,
+        live=None,
+        origin=None,
+        max_files=None,
+    ):
+        self.queue = queue
+        self.time_format = time_format
+        self.file_length = file_length
+        self.window_length = window_length
+        self.wait = wait
+        self.live = live
+        self.origin = None if origin is None else _epoch(origin)
+        self.slots = round(window_length / file_length)
+        self.max_files = max_files or 16 * self.slots
+        self.unmatched = deque(maxlen=1000)
+        self._held = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def parse(self, path):
+        """Return the start time of a file as epoch seconds, or None."""
+        return _parse(path, self.time_format)
+
+    def _add(self, files):
+        now = time.monotonic()
+        unmatched = []
+        with self._lock:
+            for file in files:
+                t = self.parse(file)
+                if t is None:
+                    unmatched.append(file)
+                    continue
+                if self.origin is None:
+                    self.origin = t % self.file_length
+                # tolerate start times rounded slightly below the grid
+                index = math.floor((t - self.origin) / self.window_length + 1e-6)
+                start = self.origin + index * self.window_length
+                slot = math.floor((t - start) / self.file_length + 1e-6)
+                if not 0 <= slot < self.slots:
+                    unmatched.append(file)
+                    continue
+                window = self._windows.setdefault(start, ([], set(), now))
+                window[0].append(file)
+                window[1].add(slot)
+                self._held += 1
+            self.unmatched.extend(unmatched)
+        if unmatched:
+            self.queue.ack(unmatched)
+
+    def _order(self):
+        starts = sorted(self._windows)
+        if self.live is None:
+            return starts
+        cutoff = time.time() - self.live
+        live = [start for start in starts if start >= cutoff]
+        return live[::-1] + starts[: len(starts) - len(live)]
+
+    def _pop_ready(self):
+        """Return the first ready window and the next expiry time."""
+        now = time.monotonic()
+        expiry = None
+        with self._lock:
+            for start in self._order():
+                files, slots, first_seen = self._windows[start]
+                complete = slots.issuperset(range(self.slots))
+                if complete or now - first_seen >= self.wait:
+                    del self._windows[start]
+                    self._held -= len(files)
+                    starttime = datetime.fromtimestamp(start, tz=timezone.utc)
+                    return Window(starttime, sorted(files), complete), None
+                if expiry is None or first_seen + self.wait < expiry:
+                    expiry = first_seen + self.wait
+        return None, expiry
+
+    def get(self, timeout=None):
+        """
+        Wait for the next window.
+
+        Parameters
+        ----------
+        timeout : int or float
+            The maximum waiting time, in seconds. None waits forever.
+
+        Returns
+        -------
+        window : Window
+            ``(starttime, files, complete)``, with the start time as a UTC
+            ``datetime``, or None if the timeout expired first. The files stay
+            claimed in the queue until :meth:`ack` is called.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            room = self.max_files - self._held
+            if room > 0:
+                self._add(self.queue.claim(room, partial=True))
+            window, expiry = self._pop_ready()
+            if window is not None:
+                return window
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return None
+            wakeups = [t - now for t in (deadline, expiry) if t is not None]
+            remaining = max(min(wakeups), 0) if wakeups else None
+            if self._held < self.max_files:
+                self._add(self.queue.get_batch(1, timeout=remaining, partial=True))
+            else:
+                # full: wait for the oldest window to expire
+                time.sleep(remaining)
+
+    def ack(self, window):
+        """Mark the files of a window as finished."""
+        self.queue.ack(window.files)
+
+    def release(self, window):
+        """Return the files of a window to the queue."""
+        self.queue.release(window.files)